@@ -0,0 +1,450 @@
+from bisect import bisect_left
+from functools import lru_cache
+import re as regex
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from nltk.tokenize import wordpunct_tokenize
+
+from inverted_index import InvertedIndex, PositionalIndex
+from normalization import TokenNormalizer
+from posting_lists import PostingList
+
+_query_token_pattern = regex.compile(r"\"[^\"]*\"?|\(|\)|[^\s()\"]+")
+_near_operator_pattern = regex.compile(r"^NEAR/(\d+)$")
+_operators = {"AND", "OR", "NOT"}
+
+
+class QuerySyntaxError(ValueError):
+	pass
+
+
+class QueryNode:
+	pass
+
+
+class TermNode(QueryNode):
+	def __init__(self, term: str):
+		self.term = term
+
+
+class PhraseNode(QueryNode):
+	def __init__(self, terms: List[str]):
+		self.terms = terms
+
+
+class NearNode(QueryNode):
+	def __init__(self, left: QueryNode, right: QueryNode, distance: int):
+		self.left = left
+		self.right = right
+		self.distance = distance
+
+
+class NotNode(QueryNode):
+	def __init__(self, operand: QueryNode):
+		self.operand = operand
+
+
+class AndNode(QueryNode):
+	def __init__(self, operands: List[QueryNode]):
+		self.operands = operands
+
+
+class OrNode(QueryNode):
+	def __init__(self, operands: List[QueryNode]):
+		self.operands = operands
+
+
+def tokenize_query(query: str) -> List[Tuple[str, int]]:
+	return [(match.group(), match.start()) for match in _query_token_pattern.finditer(query)]
+
+
+def parse_query(query: str) -> QueryNode:
+	return _QueryParser(tokenize_query(query)).parse()
+
+
+class BooleanQueryEngine:
+	def __init__(
+			self,
+			inverted_index: InvertedIndex,
+			token_normalizer: TokenNormalizer,
+			positional_index: Optional[PositionalIndex] = None,
+			plan_cache_size: int = 256):
+		self.inverted_index = inverted_index
+		self.positional_index = positional_index
+		self.all_pages = inverted_index.get_all_pages_posting_list()
+		self._token_normalizer = token_normalizer
+		# Plans depend only on the query text and the loaded index, so repeated queries skip parsing and planning
+		self._compile = lru_cache(maxsize = plan_cache_size)(self._compile_uncached)
+
+	def search(self, query: str) -> PostingList:
+		return self._compile(" ".join(query.split())).evaluate(self)
+
+	def get_plan_cache_info(self):
+		return self._compile.cache_info()
+
+	def _compile_uncached(self, query: str) -> "_QueryPlan":
+		return self._plan(parse_query(query))
+
+	def _plan(self, node: QueryNode) -> "_QueryPlan":
+		if isinstance(node, TermNode):
+			lemma = self._token_normalizer.get_lemma(node.term)
+			return _TermPlan(lemma, self.inverted_index.get_document_frequency(lemma))
+		if isinstance(node, PhraseNode):
+			return self._plan_phrase(node)
+		if isinstance(node, NearNode):
+			if self.positional_index is None:
+				raise QuerySyntaxError("Phrase and NEAR queries need a positional index")
+			left = self._plan(node.left)
+			right = self._plan(node.right)
+			assert isinstance(left, _PositionalPlan) and isinstance(right, _PositionalPlan)
+			return _NearPlan(left, right, node.distance)
+		if isinstance(node, NotNode):
+			operand = self._plan(node.operand)
+			return _NotPlan(operand, len(self.all_pages) - operand.cost)
+		if isinstance(node, AndNode):
+			return self._plan_and(node)
+		if isinstance(node, OrNode):
+			operands = [self._plan(operand) for operand in _flatten(node, OrNode)]
+			return _OrPlan(operands, min(sum(operand.cost for operand in operands), len(self.all_pages)))
+
+		raise TypeError("Unknown query node: " + type(node).__name__)
+
+	def _plan_phrase(self, node: PhraseNode) -> "_QueryPlan":
+		if self.positional_index is None:
+			raise QuerySyntaxError("Phrase and NEAR queries need a positional index")
+
+		# Positions in the index count only indexed tokens, so stop words of the phrase are skipped the same way
+		lemmas = [
+			self._token_normalizer.get_lemma(term)
+			for term in node.terms
+			if self._token_normalizer.is_valid(term)]
+		if len(lemmas) == 1:
+			return _TermPlan(lemmas[0], self.inverted_index.get_document_frequency(lemmas[0]))
+		return _PhrasePlan(
+			lemmas,
+			min((self.inverted_index.get_document_frequency(lemma) for lemma in lemmas), default = 0))
+
+	def _plan_and(self, node: AndNode) -> "_QueryPlan":
+		included: List[_QueryPlan] = []
+		excluded: List[_QueryPlan] = []
+		for operand in _flatten(node, AndNode):
+			# "A AND NOT B" subtracts B from A instead of building the complement of B
+			if isinstance(operand, NotNode):
+				excluded.append(self._plan(operand.operand))
+			else:
+				included.append(self._plan(operand))
+
+		# The rarest lists go first, so the intermediate result is as small as possible from the start
+		included.sort(key = lambda operand: operand.cost)
+		excluded.sort(key = lambda operand: operand.cost, reverse = True)
+		cost = (
+			included[0].cost
+			if len(included) > 0
+			else max(len(self.all_pages) - sum(operand.cost for operand in excluded), 0))
+		return _AndPlan(included, excluded, cost)
+
+
+class _QueryPlan:
+	def __init__(self, cost: int):
+		self.cost = cost
+
+	def evaluate(self, engine: BooleanQueryEngine) -> PostingList:
+		raise NotImplementedError()
+
+
+class _PositionalPlan(_QueryPlan):
+	def get_candidates(self, engine: BooleanQueryEngine) -> PostingList:
+		raise NotImplementedError()
+
+	# A span is the first and the last position of one occurrence in a page
+	def get_spans(self, engine: BooleanQueryEngine, page_ids: PostingList) -> Dict[int, List[Tuple[int, int]]]:
+		raise NotImplementedError()
+
+
+class _TermPlan(_PositionalPlan):
+	def __init__(self, lemma: str, cost: int):
+		super().__init__(cost)
+		self.lemma = lemma
+
+	def evaluate(self, engine: BooleanQueryEngine) -> PostingList:
+		if self.cost == 0:
+			return PostingList.empty(engine.all_pages.universe_size)
+		return engine.inverted_index.get_posting_list(self.lemma)
+
+	def get_candidates(self, engine: BooleanQueryEngine) -> PostingList:
+		return self.evaluate(engine)
+
+	def get_spans(self, engine: BooleanQueryEngine, page_ids: PostingList) -> Dict[int, List[Tuple[int, int]]]:
+		assert engine.positional_index is not None
+		page_positions = engine.positional_index.get_positions(self.lemma, set(page_ids))
+		return {page_id: [(position, position) for position in positions] for page_id, positions in page_positions.items()}
+
+
+class _PhrasePlan(_PositionalPlan):
+	def __init__(self, lemmas: List[str], cost: int):
+		super().__init__(cost)
+		self.lemmas = lemmas
+
+	def evaluate(self, engine: BooleanQueryEngine) -> PostingList:
+		return PostingList.from_sorted(
+			sorted(self.get_spans(engine, self.get_candidates(engine))),
+			engine.all_pages.universe_size)
+
+	def get_spans(self, engine: BooleanQueryEngine, page_ids: PostingList) -> Dict[int, List[Tuple[int, int]]]:
+		assert engine.positional_index is not None
+		candidates = self.get_candidates(engine) & page_ids
+		if not candidates:
+			return {}
+
+		candidate_ids = set(candidates)
+		lemma_positions = {
+			lemma: engine.positional_index.get_positions(lemma, candidate_ids)
+			for lemma in set(self.lemmas)}
+		spans: Dict[int, List[Tuple[int, int]]] = {}
+		for page_id in candidates:
+			starts = _match_phrase([lemma_positions[lemma].get(page_id, []) for lemma in self.lemmas])
+			if len(starts) > 0:
+				spans[page_id] = [(start, start + len(self.lemmas) - 1) for start in starts]
+		return spans
+
+	def get_candidates(self, engine: BooleanQueryEngine) -> PostingList:
+		# Only pages that have every word of the phrase have their positions read
+		if len(self.lemmas) == 0:
+			return PostingList.empty(engine.all_pages.universe_size)
+
+		lemmas = sorted(set(self.lemmas), key = engine.inverted_index.get_document_frequency)
+		candidates = engine.inverted_index.get_posting_list(lemmas[0])
+		for lemma in lemmas[1:]:
+			if not candidates:
+				break
+			candidates = candidates & engine.inverted_index.get_posting_list(lemma)
+		return candidates
+
+
+class _NearPlan(_QueryPlan):
+	def __init__(self, left: _PositionalPlan, right: _PositionalPlan, distance: int):
+		super().__init__(min(left.cost, right.cost))
+		self.left = left
+		self.right = right
+		self.distance = distance
+
+	def evaluate(self, engine: BooleanQueryEngine) -> PostingList:
+		candidates = self.left.get_candidates(engine) & self.right.get_candidates(engine)
+		if not candidates:
+			return candidates
+
+		left_spans = self.left.get_spans(engine, candidates)
+		right_spans = self.right.get_spans(engine, candidates)
+		return PostingList.from_sorted(
+			[
+				page_id
+				for page_id in candidates
+				if page_id in left_spans
+					and page_id in right_spans
+					and _are_spans_near(left_spans[page_id], right_spans[page_id], self.distance)],
+			engine.all_pages.universe_size)
+
+
+class _NotPlan(_QueryPlan):
+	def __init__(self, operand: _QueryPlan, cost: int):
+		super().__init__(cost)
+		self.operand = operand
+
+	def evaluate(self, engine: BooleanQueryEngine) -> PostingList:
+		return engine.all_pages - self.operand.evaluate(engine)
+
+
+class _AndPlan(_QueryPlan):
+	def __init__(self, included: List[_QueryPlan], excluded: List[_QueryPlan], cost: int):
+		super().__init__(cost)
+		self.included = included
+		self.excluded = excluded
+
+	def evaluate(self, engine: BooleanQueryEngine) -> PostingList:
+		result = self.included[0].evaluate(engine) if len(self.included) > 0 else engine.all_pages
+		for operand in self.included[1:]:
+			if not result:
+				return result
+			result = result & operand.evaluate(engine)
+		for operand in self.excluded:
+			if not result:
+				return result
+			result = result - operand.evaluate(engine)
+		return result
+
+
+class _OrPlan(_QueryPlan):
+	def __init__(self, operands: List[_QueryPlan], cost: int):
+		super().__init__(cost)
+		self.operands = operands
+
+	def evaluate(self, engine: BooleanQueryEngine) -> PostingList:
+		result = self.operands[0].evaluate(engine)
+		for operand in self.operands[1:]:
+			result = result | operand.evaluate(engine)
+		return result
+
+
+class _QueryParser:
+	# or_expression := and_expression ("OR" and_expression)*
+	# and_expression := not_expression (["AND"] not_expression)*
+	# not_expression := "NOT" not_expression | near_expression
+	# near_expression := operand ["NEAR/k" operand]
+	# operand := "(" or_expression ")" | "\"phrase\"" | term
+	def __init__(self, tokens: List[Tuple[str, int]]):
+		self._tokens = tokens
+		self._position = 0
+
+	def parse(self) -> QueryNode:
+		if len(self._tokens) == 0:
+			raise QuerySyntaxError("Query is empty")
+
+		node = self._parse_or()
+		token = self._peek()
+		if token is not None:
+			raise QuerySyntaxError(f"Unexpected \"{token[0]}\" at position {token[1]}")
+		return node
+
+	def _parse_or(self) -> QueryNode:
+		operands = [self._parse_and()]
+		while self._accept("OR"):
+			operands.append(self._parse_and())
+		return operands[0] if len(operands) == 1 else OrNode(operands)
+
+	def _parse_and(self) -> QueryNode:
+		operands = [self._parse_not()]
+		while True:
+			if self._accept("AND"):
+				operands.append(self._parse_not())
+				continue
+
+			# Operands written one after another are joined with AND
+			token = self._peek()
+			if token is None or token[0] in ["OR", ")"]:
+				break
+			operands.append(self._parse_not())
+		return operands[0] if len(operands) == 1 else AndNode(operands)
+
+	def _parse_not(self) -> QueryNode:
+		if self._accept("NOT"):
+			return NotNode(self._parse_not())
+		return self._parse_near()
+
+	def _parse_near(self) -> QueryNode:
+		left = self._parse_operand()
+		distance = self._accept_near()
+		if distance is None:
+			return left
+
+		right = self._parse_operand()
+		if not _is_positional(left) or not _is_positional(right):
+			raise QuerySyntaxError("NEAR operands must be words or phrases")
+		if self._accept_near() is not None:
+			raise QuerySyntaxError("NEAR operators cannot be chained, join them with AND")
+		return NearNode(left, right, distance)
+
+	def _parse_operand(self) -> QueryNode:
+		token = self._next("an operand")
+		if token[0] == "(":
+			node = self._parse_or()
+			self._expect(")")
+			return node
+		if token[0].startswith("\""):
+			if len(token[0]) == 1 or not token[0].endswith("\""):
+				raise QuerySyntaxError(f"Unterminated phrase at position {token[1]}")
+			return PhraseNode(wordpunct_tokenize(token[0][1:-1]))
+		if token[0] == ")" or token[0] in _operators or _near_operator_pattern.match(token[0]):
+			raise QuerySyntaxError(f"Expected an operand at position {token[1]}, got \"{token[0]}\"")
+		return TermNode(token[0])
+
+	def _peek(self) -> Optional[Tuple[str, int]]:
+		return self._tokens[self._position] if self._position < len(self._tokens) else None
+
+	def _next(self, expected: str) -> Tuple[str, int]:
+		token = self._peek()
+		if token is None:
+			raise QuerySyntaxError(f"Expected {expected} at the end of the query")
+		self._position += 1
+		return token
+
+	def _accept(self, text: str) -> bool:
+		token = self._peek()
+		if token is None or token[0] != text:
+			return False
+		self._position += 1
+		return True
+
+	def _accept_near(self) -> Optional[int]:
+		token = self._peek()
+		near_operator_match = _near_operator_pattern.match(token[0]) if token is not None else None
+		if near_operator_match is None:
+			return None
+		self._position += 1
+		return int(near_operator_match.group(1))
+
+	def _expect(self, text: str):
+		token = self._next(f"\"{text}\"")
+		if token[0] != text:
+			raise QuerySyntaxError(f"Expected \"{text}\" at position {token[1]}, got \"{token[0]}\"")
+
+
+def _is_positional(node: QueryNode) -> bool:
+	return isinstance(node, (TermNode, PhraseNode))
+
+
+def _flatten(node: QueryNode, node_type: type) -> List[QueryNode]:
+	# Nested operators of the same kind are merged, so the planner can reorder all their operands together
+	if not isinstance(node, node_type):
+		return [node]
+
+	operands: List[QueryNode] = []
+	for operand in getattr(node, "operands"):
+		operands.extend(_flatten(operand, node_type))
+	return operands
+
+
+def _match_phrase(positions: List[List[int]]) -> List[int]:
+	# The rarest word drives the search, the other words are looked up at their offsets from it
+	driver = min(range(len(positions)), key = lambda index: len(positions[index]))
+	cursors = [0] * len(positions)
+	starts: List[int] = []
+	for driver_position in positions[driver]:
+		start = driver_position - driver
+		is_match = start >= 0
+		for index, word_positions in enumerate(positions):
+			if not is_match:
+				break
+			if index == driver:
+				continue
+			cursors[index] = _gallop(word_positions, start + index, cursors[index])
+			is_match = cursors[index] < len(word_positions) and word_positions[cursors[index]] == start + index
+		if is_match:
+			starts.append(start)
+	return starts
+
+
+def _gallop(values: Sequence[int], target: int, start: int) -> int:
+	# Exponential search from the previous cursor, then a binary search inside the last step
+	if start >= len(values) or values[start] >= target:
+		return start
+
+	bound = 1
+	while start + bound < len(values) and values[start + bound] < target:
+		bound *= 2
+	return bisect_left(values, target, start + bound // 2 + 1, min(start + bound + 1, len(values)))
+
+
+def _are_spans_near(first_spans: List[Tuple[int, int]], second_spans: List[Tuple[int, int]], distance: int) -> bool:
+	first_index = 0
+	second_index = 0
+	while first_index < len(first_spans) and second_index < len(second_spans):
+		first_start, first_end = first_spans[first_index]
+		second_start, second_end = second_spans[second_index]
+		if max(first_start - second_end, second_start - first_end, 0) <= distance:
+			return True
+
+		if first_end < second_end:
+			first_index += 1
+		else:
+			second_index += 1
+	return False
@@ -0,0 +1,115 @@
+import math
+from typing import Dict, List, Mapping, Tuple
+
+import numpy
+from numpy.typing import NDArray
+
+from tf_idf_matrix import TfIdfMatrix, normalize_weights
+
+# Similarities are sums of rounded products, the slack keeps the upper bounds above them
+_upper_bound_slack = 1 + 1e-9
+
+
+class CosineSearchEngine:
+	def __init__(self, tf_idf_matrix: TfIdfMatrix):
+		self.tf_idf_matrix = tf_idf_matrix
+
+	def get_query_weights(self, query_lemma_counts: Mapping[str, int]) -> Dict[int, float]:
+		# Lemmas that are not in the vocabulary or have no weight cannot change any similarity
+		query_weights: Dict[int, float] = {}
+		for lemma, count in query_lemma_counts.items():
+			term_id = self.tf_idf_matrix.get_term_id(lemma)
+			if term_id is None:
+				continue
+			weight = count * float(self.tf_idf_matrix.idf[term_id])
+			if weight != 0:
+				query_weights[term_id] = weight
+		return query_weights
+
+	def score(self, query_weights: Mapping[int, float]) -> Tuple[NDArray[numpy.int64], NDArray[numpy.float64]]:
+		# Only the columns of the query terms are read; pages that share no term with the query are never touched
+		rows = numpy.empty(0, numpy.int64)
+		similarities = numpy.empty(0, numpy.float64)
+		for term_id, query_weight in self._get_normalized_query_weights(query_weights).items():
+			column_rows, column_weights = self.tf_idf_matrix.get_normalized_column(term_id)
+			rows, similarities = _add_sorted(rows, similarities, column_rows, column_weights * query_weight)
+		return self.tf_idf_matrix.page_ids[rows].astype(numpy.int64), similarities
+
+	def search_top_k(self, query_weights: Mapping[int, float], k: int) -> List[Tuple[int, float]]:
+		normalized_query_weights = self._get_normalized_query_weights(query_weights)
+		if k <= 0 or len(normalized_query_weights) == 0:
+			return []
+
+		# Term-at-a-time MaxScore: terms go from the largest possible contribution to the smallest. Once the
+		# contributions left cannot lift a new page above the k-th best similarity, the remaining terms only
+		# update the pages already found, and pages that cannot reach the top k any more are dropped.
+		# A query weight has the sign of the term IDF, as every page weight of the term does, so no term
+		# lowers a similarity and the k-th best one only grows
+		upper_bounds = {
+			term_id: abs(query_weight) * float(self.tf_idf_matrix.term_max_normalized_weights[term_id])
+			for term_id, query_weight in normalized_query_weights.items()}
+		term_ids = sorted(normalized_query_weights, key = lambda term_id: upper_bounds[term_id], reverse = True)
+
+		rows = numpy.empty(0, numpy.int64)
+		similarities = numpy.empty(0, numpy.float64)
+		accepts_new_pages = True
+		for term_index, term_id in enumerate(term_ids):
+			remaining_upper_bound = math.fsum(
+				upper_bounds[remaining_term_id] for remaining_term_id in term_ids[term_index + 1:]) * _upper_bound_slack
+			query_weight = normalized_query_weights[term_id]
+			if accepts_new_pages:
+				column_rows, column_weights = self.tf_idf_matrix.get_normalized_column(term_id)
+				rows, similarities = _add_sorted(rows, similarities, column_rows, column_weights * query_weight)
+			else:
+				similarities = similarities + self._get_normalized_weights(term_id, rows) * query_weight
+
+			# Only pages with a positive similarity are results, so zero is the lowest bar
+			threshold = 0.0
+			if len(similarities) >= k:
+				threshold = max(threshold, float(numpy.partition(similarities, len(similarities) - k)[len(similarities) - k]))
+			if remaining_upper_bound <= threshold:
+				accepts_new_pages = False
+				is_candidate = similarities + remaining_upper_bound >= threshold
+				if threshold == 0:
+					is_candidate &= similarities + remaining_upper_bound > 0
+				rows = rows[is_candidate]
+				similarities = similarities[is_candidate]
+
+		is_result = similarities > 0
+		page_ids = self.tf_idf_matrix.page_ids[rows[is_result]].tolist()
+		results = sorted(zip(page_ids, similarities[is_result].tolist()), key = lambda result: (-result[1], result[0]))
+		return results[:k]
+
+	def _get_normalized_query_weights(self, query_weights: Mapping[int, float]) -> Dict[int, float]:
+		# Dividing by the query norm up front makes every sum of products a cosine similarity
+		query_norm = math.sqrt(math.fsum(weight * weight for weight in query_weights.values()))
+		if query_norm == 0:
+			return {}
+		return {term_id: weight / query_norm for term_id, weight in query_weights.items()}
+
+	def _get_normalized_weights(self, term_id: int, rows: NDArray[numpy.int64]) -> NDArray[numpy.float64]:
+		# The pages are looked up in the column instead of reading it whole, so the cost depends on their number
+		column_rows, column_weights = self.tf_idf_matrix.get_column(term_id)
+		if len(column_rows) == 0 or len(rows) == 0:
+			return numpy.zeros(len(rows), numpy.float64)
+
+		positions = numpy.minimum(numpy.searchsorted(column_rows, rows), len(column_rows) - 1)
+		weights = normalize_weights(column_weights[positions], self.tf_idf_matrix.norms[rows].astype(numpy.float64))
+		return numpy.where(column_rows[positions] == rows, weights, 0.0)
+
+
+def _add_sorted(
+		rows: NDArray[numpy.int64],
+		values: NDArray[numpy.float64],
+		added_rows: NDArray[numpy.uint32],
+		added_values: NDArray[numpy.float64]) -> Tuple[NDArray[numpy.int64], NDArray[numpy.float64]]:
+	all_rows = numpy.concatenate((rows, added_rows.astype(numpy.int64)))
+	all_values = numpy.concatenate((values, added_values))
+	order = numpy.argsort(all_rows, kind = "stable")
+	all_rows = all_rows[order]
+	all_values = all_values[order]
+	if len(all_rows) == 0:
+		return all_rows, all_values
+
+	row_starts = numpy.flatnonzero(numpy.concatenate(([True], all_rows[1:] != all_rows[:-1])))
+	return all_rows[row_starts], numpy.add.reduceat(all_values, row_starts)
@@ -0,0 +1,47 @@
+import json
+from pathlib import Path
+from typing import Dict, List, Optional, Set
+
+from file_io import atomic_write
+
+
+class CrawlCheckpoint:
+	def __init__(
+			self,
+			page_urls_to_download: List[str],
+			seen_page_urls: Set[str],
+			page_outcome_links: Dict[str, Set[str]]):
+		self.page_urls_to_download = page_urls_to_download
+		self.seen_page_urls = seen_page_urls
+		self.page_outcome_links = page_outcome_links
+
+
+def save_crawl_checkpoint(file_name: str, checkpoint: CrawlCheckpoint, file_encoding: str = "utf-8") -> None:
+	serialized_checkpoint = {
+		"page_urls_to_download": checkpoint.page_urls_to_download,
+		"seen_page_urls": list(checkpoint.seen_page_urls),
+		"page_outcome_links": {
+			page_url: list(links) for page_url, links in checkpoint.page_outcome_links.items()}
+	}
+
+	with atomic_write(file_name, "w", file_encoding) as file:
+		json.dump(serialized_checkpoint, file, ensure_ascii = False)
+
+
+def load_crawl_checkpoint(file_name: str, file_encoding: str = "utf-8") -> Optional[CrawlCheckpoint]:
+	if not Path(file_name).is_file():
+		return None
+
+	with open(file_name, "r", encoding = file_encoding) as file:
+		serialized_checkpoint = json.load(file)
+
+	return CrawlCheckpoint(
+		list(serialized_checkpoint["page_urls_to_download"]),
+		set(serialized_checkpoint["seen_page_urls"]),
+		{
+			page_url: set(links)
+			for page_url, links in serialized_checkpoint["page_outcome_links"].items()})
+
+
+def delete_crawl_checkpoint(file_name: str) -> None:
+	Path(file_name).unlink(missing_ok = True)
@@ -1,12 +1,23 @@
+import argparse
+from concurrent.futures import Future, ThreadPoolExecutor
+from contextlib import contextmanager
+from functools import lru_cache
 import os
-from typing import Dict, List, Optional, Set, Union
+from pathlib import Path
+import threading
+import time
+from typing import Deque, Dict, Generator, Iterator, List, Optional, Set, Tuple, Union
 from urllib.parse import urldefrag, urljoin, urlparse
 
 from bs4 import BeautifulSoup
 from collections import deque
+from crawl_checkpoint import CrawlCheckpoint, delete_crawl_checkpoint, load_crawl_checkpoint, save_crawl_checkpoint
+from duplicates import calculate_simhash, DuplicateDetector
+from http_client import HttpClient
+from link_graph import LinkGraph, write_link_graph
 from logs import configure_log
-from raw_pages import NewRawPage, RawPageRepository
-import requests
+from page_extraction import extract_page, ExtractedPage
+from raw_pages import get_content_hash, NewRawPage, RawPageMetadata, RawPageRepository
 from text import delete_extra_whitespaces, format_exception
 import validators
 
@@ -15,102 +26,401 @@ crawler_request_headers = {
 	"accept-language": "ru-RU,ru;q=0.9,en-US;q=0.8,en;q=0.7",
 	"user-agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/102.0.0.0 Safari/537.36"
 }
+crawl_checkpoint_file_name = "raw-pages/crawl-checkpoint.json"
+changed_pages_file_name = "raw-pages/changed-pages.txt"
+links_file_name = "raw-pages/links.bin"
+legacy_links_file_name = "raw-pages/links.txt"
+page_aliases_file_name = "raw-pages/aliases.txt"
+default_whitelisted_domains = [
+	"hvost.news"
+]
+default_blacklisted_urls = [
+	"https://hvost.news/agreement/",
+	"https://hvost.news/contacts/",
+	"https://hvost.news/privacy/"
+]
 
 
 def main(
 		root_page_url: str = "https://hvost.news/",
 		max_pages_count: int = 100,
 		min_words_per_page_count: int = 0,
-		whitelisted_domains: Optional[List[str]] = [
-			"hvost.news"
-		],
-		blacklisted_urls: Optional[List[str]] = [
-			"https://hvost.news/agreement/",
-			"https://hvost.news/contacts/",
-			"https://hvost.news/privacy/"
-		]):
+		whitelisted_domains: Optional[List[str]] = default_whitelisted_domains,
+		blacklisted_urls: Optional[List[str]] = default_blacklisted_urls,
+		max_concurrent_downloads: int = 8,
+		max_concurrent_domain_downloads: int = 4,
+		min_domain_download_interval: float = 0,
+		resume: bool = False,
+		checkpoint_interval: int = 100,
+		http_client: Optional[HttpClient] = None,
+		page_parser: str = "html.parser",
+		duplicate_handling: str = "keep",
+		max_duplicate_simhash_distance: int = 3,
+		page_storage: Optional[str] = None,
+		durability: str = "flush"):
+	log = configure_log()
+	if duplicate_handling not in ["keep", "drop", "alias"]:
+		raise ValueError("Unknown duplicate handling: " + duplicate_handling)
+
+	log.debug("Initializing page repository")
+	page_repository = RawPageRepository(storage = page_storage, durability = durability)
+
+	checkpoint = load_crawl_checkpoint(crawl_checkpoint_file_name) if resume else None
+	if resume and checkpoint is None:
+		log.warning("No crawl checkpoint found, starting a new crawl")
+	if checkpoint is None:
+		page_repository.delete_all()
+		delete_crawl_checkpoint(crawl_checkpoint_file_name)
+		Path(page_aliases_file_name).unlink(missing_ok = True)
+		checkpoint = CrawlCheckpoint([root_page_url], {root_page_url}, {})
+	else:
+		log.info(f"Resuming crawl with {len(checkpoint.page_urls_to_download)} pages to download")
+
+	# Pages saved after the last checkpoint are parsed from the repository instead of being downloaded again
+	page_ids: Dict[str, int] = {url: id_ for id_, url in page_repository.get_index().items()}
+	# Aliased duplicates resolve to the id of the page they duplicate, so links to them point to that page
+	page_aliases = _read_page_aliases()
+	page_ids.update(page_aliases)
+	new_page_aliases: Dict[str, int] = {}
+	duplicate_detector = DuplicateDetector(max_duplicate_simhash_distance)
+	if duplicate_handling != "keep":
+		for id_ in page_repository.get_index():
+			metadata = page_repository.get_metadata(id_)
+			if metadata is not None:
+				duplicate_detector.add(id_, metadata.content_hash, metadata.simhash)
+	page_outcome_links = checkpoint.page_outcome_links
+	page_urls_to_download = deque(checkpoint.page_urls_to_download)
+	seen_page_urls = checkpoint.seen_page_urls
+	whitelisted_domains_set = set(whitelisted_domains) if whitelisted_domains is not None else None
+	blacklisted_urls_set: Set[str] = set(blacklisted_urls) if blacklisted_urls is not None else set()
+	domain_throttle = _DomainThrottle(max_concurrent_domain_downloads, min_domain_download_interval)
+	if http_client is None:
+		http_client = HttpClient(pool_size = max_concurrent_domain_downloads)
+
+	# Pages are downloaded ahead of time but processed strictly in the frontier order,
+	# so the repository and the links file are the same as for a sequential crawl
+	downloads: Deque[Tuple[str, "Future[Union[_DownloadedPage, Exception, None]]"]] = deque()
+	executor = ThreadPoolExecutor(max(max_concurrent_downloads, 1))
+	processed_pages_count = 0
+	try:
+		# Saved pages are committed in groups, each checkpoint commits the pages saved before it
+		with page_repository.batch():
+			while (len(downloads) > 0 or len(page_urls_to_download) > 0) \
+					and len(page_ids) - len(page_aliases) < max_pages_count:
+				while len(page_urls_to_download) > 0 and len(downloads) < max(max_concurrent_downloads, 1):
+					page_url = page_urls_to_download.popleft()
+					if page_url in page_ids:
+						log.info("Loading saved " + page_url)
+						downloads.append((page_url, executor.submit(_load_saved_page, page_repository, page_ids[page_url])))
+					else:
+						log.info("Downloading " + page_url)
+						downloads.append((page_url, executor.submit(_download, page_url, http_client, domain_throttle)))
+
+				if processed_pages_count > 0 and processed_pages_count % max(checkpoint_interval, 1) == 0:
+					_save_crawl_checkpoint(
+						page_repository,
+						new_page_aliases,
+						downloads,
+						page_urls_to_download,
+						seen_page_urls,
+						page_outcome_links)
+				processed_pages_count += 1
+
+				page_url, download = downloads.popleft()
+				downloaded_page = download.result()
+				if downloaded_page is None:
+					continue
+				if isinstance(downloaded_page, Exception):
+					log.warning(f"Unable to download {page_url}:" + os.linesep + format_exception(downloaded_page))
+					continue
+				if downloaded_page.url != page_url and downloaded_page.url in seen_page_urls:
+					continue
+				page_markup = downloaded_page.markup
+
+				try:
+					extracted_page = _extract_page(str(page_markup), page_parser)
+				except Exception as exception:
+					log.warning(
+						f"Unable to parse {page_url} as HTML:" + os.linesep
+						+ format_exception(exception) + os.linesep
+						+ "Downloaded:" + os.linesep
+						+ str(page_markup))
+					continue
+
+				is_duplicate = page_url in page_aliases
+				if page_url not in page_ids and extracted_page.count_words() >= min_words_per_page_count:
+					content_hash = get_content_hash(str(page_markup))
+					simhash = calculate_simhash(extracted_page.get_text()) if duplicate_handling != "keep" else None
+					duplicate_page_id = (duplicate_detector.find_duplicate(content_hash, simhash)
+						if duplicate_handling != "keep"
+						else None)
+					if duplicate_page_id is not None:
+						log.info(f"{page_url} duplicates page {duplicate_page_id}")
+						is_duplicate = True
+						if duplicate_handling == "alias":
+							page_aliases[page_url] = duplicate_page_id
+							page_ids[page_url] = duplicate_page_id
+							new_page_aliases[page_url] = duplicate_page_id
+					else:
+						log.debug("Saving " + page_url)
+						page_to_create = NewRawPage(
+							page_url,
+							str(page_markup),
+							downloaded_page.etag,
+							downloaded_page.last_modified,
+							simhash)
+						try:
+							page = page_repository.create(page_to_create)
+							page_ids[page.url] = page.id_
+							duplicate_detector.add(page.id_, content_hash, simhash)
+						except Exception as exception:
+							log.error(
+								f"Unable to save {page_url}:" + os.linesep + format_exception(exception))
+
+				child_urls = set(_get_link_urls(page_url, extracted_page.link_hrefs, whitelisted_domains_set, blacklisted_urls_set))
+				# A duplicate has the links of the page it duplicates, they are already saved
+				if len(child_urls) > 0 and not is_duplicate:
+					page_outcome_links[page_url] = child_urls
+
+				child_urls = child_urls.difference(seen_page_urls)
+				page_urls_to_download.extend(child_urls)
+				seen_page_urls.update(child_urls)
+
+			_save_crawl_checkpoint(
+				page_repository,
+				new_page_aliases,
+				downloads,
+				page_urls_to_download,
+				seen_page_urls,
+				page_outcome_links)
+	finally:
+		executor.shutdown(wait = True, cancel_futures = True)
+		http_client.close()
+		page_repository.close()
+
+	_save_page_outcome_links(page_ids, page_outcome_links)
+
+
+def recrawl(
+		whitelisted_domains: Optional[List[str]] = default_whitelisted_domains,
+		blacklisted_urls: Optional[List[str]] = default_blacklisted_urls,
+		max_concurrent_downloads: int = 8,
+		max_concurrent_domain_downloads: int = 4,
+		min_domain_download_interval: float = 0,
+		http_client: Optional[HttpClient] = None,
+		page_parser: str = "html.parser") -> List[int]:
 	log = configure_log()
 
 	log.debug("Initializing page repository")
 	page_repository = RawPageRepository()
-	page_repository.delete_all()
+	page_urls = page_repository.get_index()
+	page_ids = {url: id_ for id_, url in page_urls.items()}
+	page_ids.update(_read_page_aliases())
 
-	page_ids: Dict[str, int] = {}
-	page_outcome_links: Dict[str, Set[str]] = {}
-	page_urls_to_download = deque([root_page_url])
-	seen_page_urls = {root_page_url}
 	whitelisted_domains_set = set(whitelisted_domains) if whitelisted_domains is not None else None
 	blacklisted_urls_set: Set[str] = set(blacklisted_urls) if blacklisted_urls is not None else set()
-	while len(page_urls_to_download) > 0 and len(page_ids) < max_pages_count:
-		page_url = page_urls_to_download.popleft()
-		log.info("Downloading " + page_url)
-		page_markup = _download(page_url, seen_page_urls)
-		if page_markup is None:
-			continue
-		if issubclass(type(page_markup), Exception):
-			log.warning(f"Unable to download {page_url}:" + os.linesep + format_exception(Exception(page_markup)))
-			continue
-
-		try:
-			parsed_page = BeautifulSoup(str(page_markup), "html.parser")
-		except Exception as exception:
-			log.warning(
-				f"Unable to parse {page_url} as HTML:" + os.linesep
-				+ format_exception(exception) + os.linesep
-				+ "Downloaded:" + os.linesep
-				+ str(page_markup))
-			continue
+	domain_throttle = _DomainThrottle(max_concurrent_domain_downloads, min_domain_download_interval)
+	if http_client is None:
+		http_client = HttpClient(pool_size = max_concurrent_domain_downloads)
+
+	changed_page_ids: List[int] = []
+	changed_page_outcome_links: Dict[str, Set[str]] = {}
+	with http_client, ThreadPoolExecutor(max(max_concurrent_downloads, 1)) as executor:
+		for id_, page_url, downloaded_page in _iter_redownloaded_pages(
+				executor,
+				page_repository,
+				page_urls,
+				http_client,
+				domain_throttle,
+				max(max_concurrent_downloads, 1) * 2):
+			if downloaded_page is None:
+				log.debug("Not modified " + page_url)
+				continue
+			if isinstance(downloaded_page, Exception):
+				log.warning(f"Unable to download {page_url}:" + os.linesep + format_exception(downloaded_page))
+				continue
 
-		if count_words(get_text(parsed_page)) >= min_words_per_page_count:
-			log.debug("Saving " + page_url)
-			page_to_create = NewRawPage(page_url, str(page_markup))
+			metadata = page_repository.get_metadata(id_)
+			is_markup_changed = metadata is None or metadata.content_hash != get_content_hash(downloaded_page.markup)
 			try:
-				page = page_repository.create(page_to_create)
-				page_ids[page.url] = page.id_
+				page_repository.update(
+					id_,
+					NewRawPage(
+						markup = downloaded_page.markup if is_markup_changed else None,
+						etag = downloaded_page.etag,
+						last_modified = downloaded_page.last_modified))
 			except Exception as exception:
-				log.error(
-					f"Unable to save {page_url}:" + os.linesep + format_exception(exception))
-	
-		child_urls = set(_get_link_urls(page_url, parsed_page, whitelisted_domains_set, blacklisted_urls_set))
-		if len(child_urls) > 0:
-			page_outcome_links[page_url] = child_urls
-
-		child_urls = child_urls.difference(seen_page_urls)
-		page_urls_to_download.extend(child_urls)
-		seen_page_urls = seen_page_urls.union(child_urls)
-
-	_save_page_outcome_links(page_ids, page_outcome_links)
+				log.error(f"Unable to save {page_url}:" + os.linesep + format_exception(exception))
+				continue
+			if not is_markup_changed:
+				log.debug("Not changed " + page_url)
+				continue
 
+			log.info("Changed " + page_url)
+			changed_page_ids.append(id_)
+			try:
+				extracted_page = _extract_page(downloaded_page.markup, page_parser)
+			except Exception as exception:
+				log.warning(f"Unable to parse {page_url} as HTML:" + os.linesep + format_exception(exception))
+				continue
+			changed_page_outcome_links[page_url] = set(
+				_get_link_urls(page_url, extracted_page.link_hrefs, whitelisted_domains_set, blacklisted_urls_set))
+	page_repository.close()
+
+	if len(changed_page_outcome_links) > 0 and get_links_file_name() is not None:
+		page_outcome_links = {
+			page_urls[page_id]: {page_urls[link] for link in links if link in page_urls}
+			for page_id, links in read_page_outcome_links().items() if page_id in page_urls}
+		for page_url, links in changed_page_outcome_links.items():
+			if len(links) > 0:
+				page_outcome_links[page_url] = links
+			else:
+				page_outcome_links.pop(page_url, None)
+		_save_page_outcome_links(page_ids, page_outcome_links)
+
+	with open(changed_pages_file_name, "w", encoding = "utf-8") as changed_pages_file:
+		for id_ in changed_page_ids:
+			changed_pages_file.write(str(id_) + "\n")
+
+	log.info(f"{len(changed_page_ids)} of {len(page_urls)} pages changed")
+	return changed_page_ids
+
+
+def _save_crawl_checkpoint(
+		page_repository: RawPageRepository,
+		new_page_aliases: Dict[str, int],
+		downloads: Deque[Tuple[str, "Future[Union[_DownloadedPage, Exception, None]]"]],
+		page_urls_to_download: Deque[str],
+		seen_page_urls: Set[str],
+		page_outcome_links: Dict[str, Set[str]]) -> None:
+	# The checkpoint must not refer to pages or aliases that are not saved yet
+	page_repository.commit()
+	_append_page_aliases(new_page_aliases)
+	new_page_aliases.clear()
+
+	# Pages that are being downloaded are not processed yet, so they stay at the head of the frontier
+	checkpoint_page_urls_to_download = [page_url for page_url, _ in downloads]
+	checkpoint_page_urls_to_download.extend(page_urls_to_download)
+	save_crawl_checkpoint(
+		crawl_checkpoint_file_name,
+		CrawlCheckpoint(checkpoint_page_urls_to_download, seen_page_urls, page_outcome_links))
+
+
+class _DownloadedPage:
+	def __init__(self, url: str, markup: str, etag: Optional[str] = None, last_modified: Optional[str] = None):
+		self.url = url
+		self.markup = markup
+		self.etag = etag
+		self.last_modified = last_modified
+
+
+class _DomainThrottle:
+	def __init__(self, max_concurrent_downloads: int, min_download_interval: float):
+		self._max_concurrent_downloads = max(max_concurrent_downloads, 1)
+		self._min_download_interval = min_download_interval
+		self._lock = threading.Lock()
+		self._domain_semaphores: Dict[str, threading.Semaphore] = {}
+		self._domain_next_download_times: Dict[str, float] = {}
+
+	@contextmanager
+	def acquire(self, url: str) -> Generator[None, None, None]:
+		domain = urlparse(url).netloc
+		with self._lock:
+			semaphore = self._domain_semaphores.get(domain)
+			if semaphore is None:
+				semaphore = threading.Semaphore(self._max_concurrent_downloads)
+				self._domain_semaphores[domain] = semaphore
+
+		with semaphore:
+			with self._lock:
+				current_time = time.monotonic()
+				download_time = max(current_time, self._domain_next_download_times.get(domain, current_time))
+				self._domain_next_download_times[domain] = download_time + self._min_download_interval
+			if download_time > current_time:
+				time.sleep(download_time - current_time)
+
+			yield
+
+
+def _download(
+		url: str,
+		http_client: HttpClient,
+		domain_throttle: _DomainThrottle,
+		metadata: Optional[RawPageMetadata] = None) -> Union[_DownloadedPage, Exception, None]:
+	request_headers = dict(crawler_request_headers)
+	if metadata is not None and metadata.etag is not None:
+		request_headers["if-none-match"] = metadata.etag
+	if metadata is not None and metadata.last_modified is not None:
+		request_headers["if-modified-since"] = metadata.last_modified
 
-def _download(url: str, seen_page_urls: Set[str]) -> Union[str, Exception, None]:
 	try:
-		response = requests.get(url, headers = crawler_request_headers, stream = True)
+		with domain_throttle.acquire(url), http_client.get(url, request_headers) as response:
+			if response.status_code == 304:
+				return None
+
+			content_type = response.headers.get("content-type")
+			if content_type is None or len(content_type) == 0:
+				return ValueError("Empty Content-Type")
+			if "html" not in content_type:
+				return ValueError("Unknown Content-Type: " + content_type)
+
+			return _DownloadedPage(
+				response.url,
+				http_client.read_text(response),
+				response.headers.get("etag"),
+				response.headers.get("last-modified"))
+	except Exception as error:
+		return error
 
-		if response.url != url and response.url in seen_page_urls:
-			return None
 
-		content_type = response.headers.get("content-type")
-		if content_type is None or len(content_type) == 0:
-			return ValueError("Empty Content-Type")
-		if "html" not in content_type:
-			return ValueError("Unknown Content-Type: " + content_type)
+def _iter_redownloaded_pages(
+		executor: ThreadPoolExecutor,
+		page_repository: RawPageRepository,
+		page_urls: Dict[int, str],
+		http_client: HttpClient,
+		domain_throttle: _DomainThrottle,
+		max_pending_downloads: int) -> Iterator[Tuple[int, str, Union[_DownloadedPage, Exception, None]]]:
+	# Only a few downloads are ahead of the one being processed, so the downloaded pages held in memory
+	# do not grow with the corpus
+	downloads: Deque[Tuple[int, str, "Future[Union[_DownloadedPage, Exception, None]]"]] = deque()
+	for id_, page_url in page_urls.items():
+		metadata = page_repository.get_metadata(id_)
+		downloads.append((id_, page_url, executor.submit(_download, page_url, http_client, domain_throttle, metadata)))
+		if len(downloads) >= max_pending_downloads:
+			id_, page_url, download = downloads.popleft()
+			yield id_, page_url, download.result()
+
+	while len(downloads) > 0:
+		id_, page_url, download = downloads.popleft()
+		yield id_, page_url, download.result()
+
+
+def _load_saved_page(page_repository: RawPageRepository, id_: int) -> Union[_DownloadedPage, Exception, None]:
+	try:
+		page = page_repository.get(id_)
+		if page is None:
+			return KeyError(f"Page {id_} is not found")
 
-		return response.text
+		return _DownloadedPage(page.url, page.markup)
 	except Exception as error:
 		return error
 
 
+def _extract_page(markup: str, page_parser: str) -> ExtractedPage:
+	if page_parser != "beautifulsoup":
+		return extract_page(markup, page_parser)
+
+	parsed_page = BeautifulSoup(markup, "html.parser")
+	a_tags = parsed_page.body.find_all("a") if parsed_page.body is not None else []
+	return ExtractedPage([str(tag.get("href", default = "")) for tag in a_tags], [get_text(parsed_page)])
+
+
 def _get_link_urls(
 		current_url: str,
-		parsed_page: BeautifulSoup,
+		link_hrefs: List[str],
 		whitelisted_domains: Optional[Set[str]],
 		blacklisted_urls: Set[str]) -> List[str]:
-	if parsed_page.body is None:
-		return []
-
-	a_tags = parsed_page.body.find_all("a")
-	urls = (tag.get("href", default = "") for tag in a_tags)
-	urls = ((url, urldefrag(urljoin(current_url, url))[0]) for url in urls)
+	urls = ((href, _resolve_url(current_url, href)) for href in link_hrefs)
 	return list(
 		map(
 			lambda url_pair: url_pair[1],
@@ -124,12 +434,33 @@ def is_url_valid(
 		url: str,
 		whitelisted_domains: Optional[Set[str]],
 		blacklisted_urls: Set[str]) -> bool:
-	if not validators.url(url) or url in blacklisted_urls:
+	if not _is_url_well_formed(url) or url in blacklisted_urls:
 		return False
 
+	return (whitelisted_domains is None or _get_url_domain(url) in whitelisted_domains) \
+		and _is_link_scheme_crawlable(original_url)
+
+
+# The same links appear on almost every page of a site, so URL parsing results are cached
+@lru_cache(maxsize = 65536)
+def _resolve_url(current_url: str, href: str) -> str:
+	return urldefrag(urljoin(current_url, href))[0]
+
+
+@lru_cache(maxsize = 65536)
+def _is_url_well_formed(url: str) -> bool:
+	return bool(validators.url(url))
+
+
+@lru_cache(maxsize = 65536)
+def _get_url_domain(url: str) -> str:
+	return urlparse(url).netloc
+
+
+@lru_cache(maxsize = 65536)
+def _is_link_scheme_crawlable(original_url: str) -> bool:
 	parsed_original_url = urlparse(original_url)
-	return (whitelisted_domains is None or urlparse(url).netloc in whitelisted_domains) \
-		and parsed_original_url.scheme in ["", "http", "https"] \
+	return parsed_original_url.scheme in ["", "http", "https"] \
 		and not (parsed_original_url.scheme == "" and ":" in parsed_original_url.path) # avoid tel, mailto, and similar links
 
 
@@ -144,27 +475,83 @@ def count_words(text: str) -> int:
 
 
 def _save_page_outcome_links(page_ids: Dict[str, int], page_outcome_links: Dict[str, Set[str]]) -> None:
-	with open("raw-pages/links.txt", "w", encoding = "utf-8") as links_file:
-		for page_url, links in page_outcome_links.items():
-			if page_url not in page_ids:
-				continue
-				
-			links_line_ids = [page_ids[page_url]]
-			links_line_ids += [page_ids[link] for link in filter(lambda link: link in page_ids, links)]
-			links_file.write(" ".join(str(link_id) for link_id in links_line_ids) + "\n")
+	outcome_links: Dict[int, List[int]] = {}
+	for page_url, links in page_outcome_links.items():
+		if page_url not in page_ids:
+			continue
+
+		# Aliased duplicates share an id, so a page may link to the same id through several URLs
+		outcome_links[page_ids[page_url]] = list(
+			dict.fromkeys(page_ids[link] for link in filter(lambda link: link in page_ids, links)))
+
+	write_link_graph(links_file_name, outcome_links)
+	# The text file of older crawls is replaced by the graph file
+	Path(legacy_links_file_name).unlink(missing_ok = True)
+
+
+def _read_page_aliases() -> Dict[str, int]:
+	page_aliases: Dict[str, int] = {}
+	if not Path(page_aliases_file_name).is_file():
+		return page_aliases
+
+	with open(page_aliases_file_name, "r", encoding = "utf-8") as page_aliases_file:
+		for line in page_aliases_file:
+			line_values = line.rstrip("\n").split(" ")
+			if len(line_values) == 2:
+				page_aliases[line_values[1]] = int(line_values[0])
+
+	return page_aliases
+
+
+def _append_page_aliases(page_aliases: Dict[str, int]) -> None:
+	if len(page_aliases) == 0:
+		return
+
+	with open(page_aliases_file_name, "a", encoding = "utf-8") as page_aliases_file:
+		for page_url, id_ in page_aliases.items():
+			page_aliases_file.write(f"{id_} {page_url}\n")
+
+
+def get_links_file_name() -> Optional[str]:
+	if Path(links_file_name).is_file():
+		return links_file_name
+	if Path(legacy_links_file_name).is_file():
+		return legacy_links_file_name
+	return None
 
 
 def read_page_outcome_links() -> Dict[int, List[int]]:
+	if not Path(links_file_name).is_file():
+		return _read_legacy_page_outcome_links()
+
+	with LinkGraph(links_file_name) as link_graph:
+		return link_graph.to_outcome_links()
+
+
+def _read_legacy_page_outcome_links() -> Dict[int, List[int]]:
 	links: Dict[int, List[int]] = {}
-	with open("raw-pages/links.txt", "r", encoding = "utf-8") as links_file:
-		line = links_file.readline().rstrip()
-		while line:
+	with open(legacy_links_file_name, "r", encoding = "utf-8") as links_file:
+		for line in links_file:
 			line_ids = [int(id_) for id_ in line.split()]
-			links[line_ids[0]] = line_ids[1:]
-			line = links_file.readline()
+			if len(line_ids) > 0:
+				links[line_ids[0]] = line_ids[1:]
 
 	return links
 
 
 if __name__ == "__main__":
-	main()
+	argument_parser = argparse.ArgumentParser()
+	mode_arguments = argument_parser.add_mutually_exclusive_group()
+	mode_arguments.add_argument(
+		"--resume",
+		action = "store_true",
+		help = "continue the crawl from the last checkpoint instead of starting over")
+	mode_arguments.add_argument(
+		"--recrawl",
+		action = "store_true",
+		help = "download saved pages again if they changed and list the changed page ids")
+	arguments = argument_parser.parse_args()
+	if arguments.recrawl:
+		recrawl()
+	else:
+		main(resume = arguments.resume)
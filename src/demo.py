@@ -1,10 +1,15 @@
-from typing import Dict, List
+from typing import Dict, List, Optional
 
 from flask import Flask, render_template, request
 from urllib.parse import unquote_plus
 
 import page_rank
 import task_5
+from task_4 import lemma_tf_idf_matrix_file_name
+from tf_idf_matrix import TfIdfMatrix
+
+
+search_result_count = 20
 
 
 class SearchResult:
@@ -15,20 +20,16 @@ class SearchResult:
 
 
 class VectorSearch:
-    def __init__(self, index: Dict[int, str]):
-        self.pc = task_5.ProcessingContext()
-        self.vector_search = task_5.VectorSearch()
+    def __init__(self, index: Dict[int, str], tf_idf_matrix: TfIdfMatrix):
+        self.pc = task_5.QueryContext()
+        self.vector_search = task_5.VectorSearch(tf_idf_matrix)
+        self.tf_idf_matrix = tf_idf_matrix
         self.index = index
-        self.lemmas_tf_idf, self.lemmas_idf = self.vector_search.calculate_pages_tf_idf()
 
     def search(self, query: str) -> List[SearchResult]:
-        query_lemmas_tf_idf = self.vector_search.calculate_query_tf_idf(
+        found_documents = self.vector_search.search_top_k(
             self.vector_search.calculate_query_tf(self.pc, query),
-            self.lemmas_idf)
-        complemented_pages_vector = self.vector_search.complement_page_vector(
-            self.lemmas_tf_idf,
-            query_lemmas_tf_idf)
-        found_documents = self.vector_search.search(complemented_pages_vector, query_lemmas_tf_idf)
+            search_result_count)
 
         results: List[SearchResult] = []
         for page_id, distance_to_page in found_documents:
@@ -61,14 +62,38 @@ class VectorSearch:
             result.score = (1 - (result.score - min_score) / min_max_score_difference) * 100
 
 
-index = task_5.get_index() 
-vector_search = VectorSearch(index)
+def load_vector_search(index: Dict[int, str]) -> Optional[VectorSearch]:
+    # The server never tokenizes pages: it maps the matrix written by task_4, so the weights are read-only
+    # and every worker process shares the same pages of the file through the page cache
+    try:
+        tf_idf_matrix = TfIdfMatrix(lemma_tf_idf_matrix_file_name)
+    except (OSError, ValueError) as error:
+        app.logger.error("The search index is not available, run task_4.py to build it: %s", error)
+        return None
+    return VectorSearch(index, tf_idf_matrix)
+
 
 app = Flask(__name__, static_folder = "../static", template_folder = "../templates")
 
+index = task_5.get_index()
+vector_search = load_vector_search(index)
+
+
+@app.route("/ready")
+def ready():
+    if vector_search is None:
+        return {"ready": False}, 503
+    return {
+        "ready": True,
+        "page_count": len(vector_search.tf_idf_matrix),
+        "term_count": vector_search.tf_idf_matrix.get_term_count()}
+
 
 @app.route("/")
 def search():
+    if vector_search is None:
+        return "The search index is not built yet", 503
+
     decoded_query = unquote_plus(bytes.decode(request.query_string, errors = "replace"))
     search_query = decoded_query[len("query="):]
     search_results = vector_search.search(search_query)
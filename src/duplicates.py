@@ -0,0 +1,64 @@
+import hashlib
+from typing import Dict, List, Optional, Tuple
+
+simhash_size = 64
+
+
+def calculate_simhash(text: str, shingle_size: int = 3) -> int:
+	words = text.lower().split()
+	shingles = (
+		[" ".join(words[i:i + shingle_size]) for i in range(len(words) - shingle_size + 1)]
+		if len(words) >= shingle_size
+		else [" ".join(words)])
+
+	bit_weights = [0] * simhash_size
+	for shingle in shingles:
+		shingle_hash = int.from_bytes(hashlib.blake2b(shingle.encode("utf-8"), digest_size = 8).digest(), "big")
+		for bit in range(simhash_size):
+			bit_weights[bit] += 1 if shingle_hash >> bit & 1 else -1
+
+	simhash = 0
+	for bit in range(simhash_size):
+		if bit_weights[bit] > 0:
+			simhash |= 1 << bit
+	return simhash
+
+
+def get_hamming_distance(first_hash: int, second_hash: int) -> int:
+	return bin(first_hash ^ second_hash).count("1")
+
+
+class DuplicateDetector:
+	def __init__(self, max_hamming_distance: int = 3):
+		self._max_hamming_distance = max_hamming_distance
+		# Hashes within the distance share at least one of distance + 1 bands, so only pages in the same band are compared
+		self._band_count = max_hamming_distance + 1
+		self._band_size = simhash_size // self._band_count
+
+		self._content_hash_page_ids: Dict[str, int] = {}
+		self._simhash_bands: List[Dict[int, List[Tuple[int, int]]]] = [{} for _ in range(self._band_count)]
+
+	def find_duplicate(self, content_hash: str, simhash: Optional[int]) -> Optional[int]:
+		page_id = self._content_hash_page_ids.get(content_hash)
+		if page_id is not None or simhash is None:
+			return page_id
+
+		for band_index, band in enumerate(self._simhash_bands):
+			for candidate_simhash, candidate_page_id in band.get(self._get_band_value(simhash, band_index), []):
+				if get_hamming_distance(simhash, candidate_simhash) <= self._max_hamming_distance:
+					return candidate_page_id
+
+		return None
+
+	def add(self, page_id: int, content_hash: str, simhash: Optional[int]) -> None:
+		self._content_hash_page_ids.setdefault(content_hash, page_id)
+		if simhash is None:
+			return
+
+		for band_index, band in enumerate(self._simhash_bands):
+			band.setdefault(self._get_band_value(simhash, band_index), []).append((simhash, page_id))
+
+	def _get_band_value(self, simhash: int, band_index: int) -> int:
+		if band_index == self._band_count - 1:
+			return simhash >> band_index * self._band_size
+		return simhash >> band_index * self._band_size & (1 << self._band_size) - 1
@@ -0,0 +1,96 @@
+from contextlib import contextmanager
+import mmap
+import os
+from pathlib import Path
+import struct
+import threading
+from typing import IO, Any, Generator, Optional, Sequence, Tuple, TypeVar, Union
+
+import numpy
+from numpy.typing import NDArray
+
+# Every array starts at a multiple of 8 bytes, so NumPy views of the mapped file are aligned
+section_alignment = 8
+
+_Scalar = TypeVar("_Scalar", bound = numpy.generic)
+_MappedFile = TypeVar("_MappedFile", bound = "MappedFile")
+
+
+@contextmanager
+def atomic_write(
+		file_name: Union[str, Path],
+		mode: str = "wb",
+		encoding: Optional[str] = None,
+		fsync: bool = True) -> Generator[IO[Any], None, None]:
+	# The file is written under a temporary name and renamed once complete, so a crash never leaves it half-written.
+	# The name is unique to the writing process and thread, so concurrent writers never replace each other's file
+	temporary_file_name = f"{file_name}.{os.getpid()}.{threading.get_ident()}.tmp"
+	try:
+		with open(temporary_file_name, mode, encoding = encoding) as file:
+			yield file
+			file.flush()
+			if fsync:
+				os.fsync(file.fileno())
+		os.replace(temporary_file_name, file_name)
+	except BaseException:
+		if os.path.exists(temporary_file_name):
+			os.remove(temporary_file_name)
+		raise
+
+
+def write_aligned_sections(file_name: Union[str, Path], header: bytes, sections: Sequence[bytes]) -> None:
+	with atomic_write(file_name) as file:
+		file.write(header)
+		for section in sections:
+			file.write(section)
+			file.write(bytes(get_padding_size(len(section))))
+
+
+def get_padding_size(size: int) -> int:
+	return -size % section_alignment
+
+
+class MappedFile:
+	def __init__(self, file_name: Union[str, Path], header: struct.Struct, magic: bytes, version: int, description: str):
+		self._file = open(file_name, "rb")
+		try:
+			self._mmap = mmap.mmap(self._file.fileno(), 0, access = mmap.ACCESS_READ)
+		except ValueError:
+			# An empty file cannot be mapped
+			self._file.close()
+			raise ValueError(f"{file_name} is not a {description} file")
+
+		if len(self._mmap) < header.size:
+			self._close_file()
+			raise ValueError(f"{file_name} is not a {description} file")
+		header_values: Tuple[Any, ...] = header.unpack_from(self._mmap, 0)
+		if header_values[0] != magic or header_values[1] != version:
+			self._close_file()
+			raise ValueError(f"{file_name} has an unsupported {description} format")
+
+		# The header starts with the magic and the format version, the rest is left to the format
+		self._header_values = header_values[2:]
+		self._section_offset = header.size
+
+	def close(self) -> None:
+		# The mapping cannot be closed while NumPy views of it are alive
+		array_names = [name for name, value in vars(self).items() if isinstance(value, numpy.ndarray)]
+		for name in array_names:
+			delattr(self, name)
+		self._close_file()
+
+	def __enter__(self: _MappedFile) -> _MappedFile:
+		return self
+
+	def __exit__(self, *_: object) -> None:
+		self.close()
+
+	def _close_file(self):
+		self._mmap.close()
+		self._file.close()
+
+	def _read_array(self, dtype: "numpy.dtype[_Scalar]", count: int) -> NDArray[_Scalar]:
+		array = numpy.frombuffer(self._mmap, dtype, count, self._section_offset)
+		size = count * dtype.itemsize
+		self._section_offset += size + get_padding_size(size)
+		return array
@@ -0,0 +1,96 @@
+from contextlib import contextmanager
+import threading
+from typing import Dict, Generator, List, Mapping, Tuple
+from urllib.parse import urlparse
+
+from charset_normalizer import detect
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+
+class ResponseTooLargeError(ValueError):
+	pass
+
+
+class HttpClient:
+	def __init__(
+			self,
+			pool_size: int = 4,
+			max_retries: int = 3,
+			retry_backoff_factor: float = 0.5,
+			connect_timeout: float = 10,
+			read_timeout: float = 30,
+			max_response_size: int = 10 * 1024 * 1024):
+		self._pool_size = max(pool_size, 1)
+		self._max_retries = max_retries
+		self._retry_backoff_factor = retry_backoff_factor
+		self._timeout: Tuple[float, float] = (connect_timeout, read_timeout)
+		self._max_response_size = max_response_size
+
+		self._lock = threading.Lock()
+		self._host_sessions: Dict[str, requests.Session] = {}
+
+	@contextmanager
+	def get(self, url: str, headers: Mapping[str, str]) -> Generator[requests.Response, None, None]:
+		session = self._get_session(urlparse(url).netloc)
+		# The response is closed on exit so its connection returns to the pool even if the body is not read
+		with session.get(url, headers = headers, stream = True, timeout = self._timeout) as response:
+			yield response
+
+	def read_text(self, response: requests.Response) -> str:
+		content_length = response.headers.get("content-length")
+		if content_length is not None and content_length.isdigit() and int(content_length) > self._max_response_size:
+			raise ResponseTooLargeError(f"Response is larger than {self._max_response_size} bytes: {content_length}")
+
+		chunks: List[bytes] = []
+		content_size = 0
+		for chunk in response.iter_content(64 * 1024):
+			content_size += len(chunk)
+			if content_size > self._max_response_size:
+				raise ResponseTooLargeError(f"Response is larger than {self._max_response_size} bytes")
+			chunks.append(chunk)
+		content = b"".join(chunks)
+
+		encoding = response.encoding
+		if encoding is None:
+			encoding = detect(content)["encoding"] or "utf-8"
+		try:
+			return str(content, encoding, errors = "replace")
+		except LookupError:
+			return str(content, "utf-8", errors = "replace")
+
+	def close(self) -> None:
+		with self._lock:
+			for session in self._host_sessions.values():
+				session.close()
+			self._host_sessions = {}
+
+	def __enter__(self) -> "HttpClient":
+		return self
+
+	def __exit__(self, *_: object) -> None:
+		self.close()
+
+	def _get_session(self, host: str) -> requests.Session:
+		with self._lock:
+			session = self._host_sessions.get(host)
+			if session is None:
+				session = self._create_session()
+				self._host_sessions[host] = session
+
+			return session
+
+	def _create_session(self) -> requests.Session:
+		retry = Retry(
+			total = self._max_retries,
+			backoff_factor = self._retry_backoff_factor,
+			status_forcelist = [429, 500, 502, 503, 504],
+			allowed_methods = ["GET"],
+			raise_on_status = False)
+		adapter = HTTPAdapter(pool_connections = 1, pool_maxsize = self._pool_size, max_retries = retry)
+
+		session = requests.Session()
+		session.mount("http://", adapter)
+		session.mount("https://", adapter)
+		return session
@@ -0,0 +1,149 @@
+from collections import deque
+from concurrent.futures import Future, ProcessPoolExecutor
+import os
+from typing import Callable, Deque, Dict, Iterable, Iterator, List, Optional, Sequence, Tuple, TypeVar
+
+from bs4 import BeautifulSoup
+from nltk.tokenize import wordpunct_tokenize
+import pymorphy3
+
+from normalization import TokenNormalizer
+from raw_pages import RawPageRepository
+
+_PageResult = TypeVar("_PageResult")
+
+_worker_token_normalizer: Optional[TokenNormalizer] = None
+
+
+def extract_tokens(token_normalizer: TokenNormalizer, markup: str) -> List[str]:
+	return [token for token, _ in extract_lemmatized_tokens(token_normalizer, markup)]
+
+
+def extract_lemmatized_tokens(token_normalizer: TokenNormalizer, markup: str) -> List[Tuple[str, str]]:
+	# The lemma comes from the same parse that validates the token, so callers never lemmatize the tokens again
+	text = BeautifulSoup(markup, features = "html.parser").get_text()
+	lemmatized_tokens: List[Tuple[str, str]] = []
+	for token in wordpunct_tokenize(text):
+		is_valid, lemma = token_normalizer.normalize(token)
+		if is_valid:
+			lemmatized_tokens.append((token, lemma))
+	return lemmatized_tokens
+
+
+def count_tokens(token_normalizer: TokenNormalizer, markup: str) -> Dict[str, int]:
+	# Tokens keep the order of their first occurrence, the TF-IDF files are written in it
+	token_counts: Dict[str, int] = {}
+	for token in extract_tokens(token_normalizer, markup):
+		token_counts[token] = token_counts.get(token, 0) + 1
+	return token_counts
+
+
+def count_terms(token_normalizer: TokenNormalizer, markup: str) -> Tuple[Dict[str, int], Dict[str, int]]:
+	# Tokens and lemmas keep the order of their first occurrence
+	token_counts: Dict[str, int] = {}
+	lemma_counts: Dict[str, int] = {}
+	for token, lemma in extract_lemmatized_tokens(token_normalizer, markup):
+		token_counts[token] = token_counts.get(token, 0) + 1
+		lemma_counts[lemma] = lemma_counts.get(lemma, 0) + 1
+	return token_counts, lemma_counts
+
+
+def iter_page_token_counts(
+		page_repository: RawPageRepository,
+		token_normalizer: TokenNormalizer,
+		workers: Optional[int] = None,
+		pages_per_task: int = 16,
+		page_ids: Optional[Sequence[int]] = None) -> Iterator[Tuple[int, Dict[str, int]]]:
+	return _iter_page_results(page_repository, token_normalizer, count_tokens, workers, pages_per_task, page_ids)
+
+
+def iter_page_tokens(
+		page_repository: RawPageRepository,
+		token_normalizer: TokenNormalizer,
+		workers: Optional[int] = None,
+		pages_per_task: int = 16,
+		page_ids: Optional[Sequence[int]] = None) -> Iterator[Tuple[int, List[str]]]:
+	return _iter_page_results(page_repository, token_normalizer, extract_tokens, workers, pages_per_task, page_ids)
+
+
+def iter_page_term_counts(
+		page_repository: RawPageRepository,
+		token_normalizer: TokenNormalizer,
+		workers: Optional[int] = None,
+		pages_per_task: int = 16,
+		page_ids: Optional[Sequence[int]] = None) -> Iterator[Tuple[int, Tuple[Dict[str, int], Dict[str, int]]]]:
+	return _iter_page_results(page_repository, token_normalizer, count_terms, workers, pages_per_task, page_ids)
+
+
+def iter_page_lemmatized_tokens(
+		page_repository: RawPageRepository,
+		token_normalizer: TokenNormalizer,
+		workers: Optional[int] = None,
+		pages_per_task: int = 16,
+		page_ids: Optional[Sequence[int]] = None) -> Iterator[Tuple[int, List[Tuple[str, str]]]]:
+	return _iter_page_results(
+		page_repository,
+		token_normalizer,
+		extract_lemmatized_tokens,
+		workers,
+		pages_per_task,
+		page_ids)
+
+
+def _iter_page_results(
+		page_repository: RawPageRepository,
+		token_normalizer: TokenNormalizer,
+		process_page: Callable[[TokenNormalizer, str], _PageResult],
+		workers: Optional[int],
+		pages_per_task: int,
+		page_ids: Optional[Sequence[int]]) -> Iterator[Tuple[int, _PageResult]]:
+	if workers is None:
+		workers = os.cpu_count() or 1
+		if page_ids is not None:
+			# A few changed pages are not worth starting a worker per CPU for
+			workers = min(workers, (len(page_ids) + pages_per_task - 1) // pages_per_task)
+	if workers <= 1:
+		for page in page_repository.iter_pages(page_ids, read_ahead = 8):
+			yield page.id_, process_page(token_normalizer, page.markup)
+		return
+
+	# Pages are read here and sent to the workers in index order; results are taken in the same order,
+	# so the output does not depend on which worker finishes first
+	with ProcessPoolExecutor(workers, initializer = _initialize_worker, initargs = (token_normalizer.stop_words,)) as executor:
+		tasks: Deque[Future[List[Tuple[int, _PageResult]]]] = deque()
+		for pages in _split_pages(page_repository, pages_per_task, page_ids):
+			tasks.append(executor.submit(_process_pages, process_page, pages))
+			# Two tasks per worker keep every worker busy without holding the whole corpus in memory
+			if len(tasks) >= workers * 2:
+				yield from tasks.popleft().result()
+
+		while len(tasks) > 0:
+			yield from tasks.popleft().result()
+
+
+def _split_pages(
+		page_repository: RawPageRepository,
+		pages_per_task: int,
+		page_ids: Optional[Sequence[int]]) -> Iterator[List[Tuple[int, str]]]:
+	pages: List[Tuple[int, str]] = []
+	for page in page_repository.iter_pages(page_ids, read_ahead = 8):
+		pages.append((page.id_, page.markup))
+		if len(pages) >= pages_per_task:
+			yield pages
+			pages = []
+
+	if len(pages) > 0:
+		yield pages
+
+
+def _initialize_worker(stop_words: Iterable[str]):
+	global _worker_token_normalizer
+	# Each worker loads the morphology dictionaries once and keeps its own token cache
+	_worker_token_normalizer = TokenNormalizer(pymorphy3.MorphAnalyzer(), stop_words)
+
+
+def _process_pages(
+		process_page: Callable[[TokenNormalizer, str], _PageResult],
+		pages: List[Tuple[int, str]]) -> List[Tuple[int, _PageResult]]:
+	assert _worker_token_normalizer is not None
+	return [(id_, process_page(_worker_token_normalizer, markup)) for id_, markup in pages]
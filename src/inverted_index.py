@@ -0,0 +1,265 @@
+from array import array
+from functools import lru_cache
+import mmap
+from pathlib import Path
+import struct
+import sys
+from typing import Collection, Dict, Iterable, Iterator, List, Mapping, Optional, Tuple, Union
+
+from file_io import MappedFile, atomic_write
+from posting_lists import PostingList
+
+inverted_index_format_version = 1
+
+# Header: magic, format version, page count, term count, term bytes size
+_header = struct.Struct("<4sIIIQ")
+_inverted_index_magic = b"IIDX"
+_positional_index_magic = b"PIDX"
+# Term directory record: term offset, term length, postings offset, postings length, document frequency
+_term_record = struct.Struct("<QIQII")
+
+
+def encode_varint(value: int, encoded: bytearray) -> None:
+	while value >= 0x80:
+		encoded.append(value & 0x7F | 0x80)
+		value >>= 7
+	encoded.append(value)
+
+
+def decode_varint(encoded: Union[bytes, memoryview, mmap.mmap], position: int) -> Tuple[int, int]:
+	value = 0
+	shift = 0
+	while True:
+		byte = encoded[position]
+		position += 1
+		value |= (byte & 0x7F) << shift
+		if not byte & 0x80:
+			return value, position
+		shift += 7
+
+
+def encode_postings(page_ids: Iterable[int]) -> bytes:
+	# Page ids are sorted and stored as varint-encoded gaps, so dense postings take about a byte per page
+	encoded = bytearray()
+	previous_page_id = 0
+	for page_id in sorted(page_ids):
+		encode_varint(page_id - previous_page_id, encoded)
+		previous_page_id = page_id
+	return bytes(encoded)
+
+
+def decode_postings(encoded: Union[bytes, memoryview, mmap.mmap], start: int = 0, end: Optional[int] = None) -> List[int]:
+	if end is None:
+		end = len(encoded)
+
+	page_ids: List[int] = []
+	page_id = 0
+	gap = 0
+	shift = 0
+	for position in range(start, end):
+		byte = encoded[position]
+		gap |= (byte & 0x7F) << shift
+		if byte & 0x80:
+			shift += 7
+		else:
+			page_id += gap
+			page_ids.append(page_id)
+			gap = 0
+			shift = 0
+	return page_ids
+
+
+def encode_positional_postings(page_positions: Mapping[int, Iterable[int]]) -> bytes:
+	# Every page entry is its page id gap, the byte size of its positions and the positions as varint gaps;
+	# the size lets a reader skip the positions of pages it does not need
+	encoded = bytearray()
+	previous_page_id = 0
+	for page_id in sorted(page_positions):
+		encoded_positions = encode_postings(page_positions[page_id])
+		encode_varint(page_id - previous_page_id, encoded)
+		encode_varint(len(encoded_positions), encoded)
+		encoded += encoded_positions
+		previous_page_id = page_id
+	return bytes(encoded)
+
+
+def write_inverted_index(
+		file_name: Union[str, Path],
+		inverted_index: Mapping[str, Iterable[int]],
+		page_ids: Iterable[int]) -> None:
+	postings: Dict[str, Tuple[bytes, int]] = {}
+	for term, term_page_ids in inverted_index.items():
+		unique_page_ids = set(term_page_ids)
+		postings[term] = (encode_postings(unique_page_ids), len(unique_page_ids))
+	_write_term_file(file_name, _inverted_index_magic, postings, page_ids)
+
+
+def write_positional_index(
+		file_name: Union[str, Path],
+		positional_index: Mapping[str, Mapping[int, Iterable[int]]],
+		page_ids: Iterable[int]) -> None:
+	postings = {
+		term: (encode_positional_postings(page_positions), len(page_positions))
+		for term, page_positions in positional_index.items()}
+	_write_term_file(file_name, _positional_index_magic, postings, page_ids)
+
+
+class _TermFile(MappedFile):
+	def __init__(self, file_name: Union[str, Path], magic: bytes, description: str):
+		super().__init__(file_name, _header, magic, inverted_index_format_version, description)
+		self._page_count, self._term_count, term_bytes_size = self._header_values
+
+		# The sections are not padded, so their offsets are calculated here instead of read with _read_array
+		self._page_ids_offset = self._section_offset
+		self._term_records_offset = self._page_ids_offset + self._page_count * 4
+		self._terms_offset = self._term_records_offset + self._term_count * _term_record.size
+		self._postings_offset = self._terms_offset + term_bytes_size
+
+		self._page_ids: Optional[List[int]] = None
+
+	def __len__(self) -> int:
+		return self._term_count
+
+	def __contains__(self, term: str) -> bool:
+		return self._find_term_index(term) is not None
+
+	def get_page_count(self) -> int:
+		return self._page_count
+
+	def get_all_page_ids(self) -> List[int]:
+		if self._page_ids is None:
+			page_ids = array("I")
+			page_ids.frombytes(self._mmap[self._page_ids_offset:self._term_records_offset])
+			if sys.byteorder == "big":
+				page_ids.byteswap()
+			self._page_ids = page_ids.tolist()
+		return self._page_ids
+
+	def get_universe_size(self) -> int:
+		page_ids = self.get_all_page_ids()
+		return page_ids[-1] + 1 if len(page_ids) > 0 else 0
+
+	def get_document_frequency(self, term: str) -> int:
+		term_index = self._find_term_index(term)
+		return 0 if term_index is None else self._read_term_record(term_index)[4]
+
+	def iter_terms(self) -> Iterator[str]:
+		for term_index in range(self._term_count):
+			yield self._read_term(term_index).decode("utf-8")
+
+	def _find_postings(self, term: str) -> Optional[Tuple[int, int]]:
+		term_index = self._find_term_index(term)
+		if term_index is None:
+			return None
+
+		_, _, postings_offset, postings_length, _ = self._read_term_record(term_index)
+		start = self._postings_offset + postings_offset
+		return start, start + postings_length
+
+	def _find_term_index(self, term: str) -> Optional[int]:
+		encoded_term = term.encode("utf-8")
+		low = 0
+		high = self._term_count
+		while low < high:
+			middle = (low + high) // 2
+			middle_term = self._read_term(middle)
+			if middle_term < encoded_term:
+				low = middle + 1
+			elif middle_term > encoded_term:
+				high = middle
+			else:
+				return middle
+		return None
+
+	def _read_term(self, term_index: int) -> bytes:
+		term_offset, term_length, _, _, _ = self._read_term_record(term_index)
+		start = self._terms_offset + term_offset
+		return self._mmap[start:start + term_length]
+
+	def _read_term_record(self, term_index: int) -> Tuple[int, int, int, int, int]:
+		return _term_record.unpack_from(self._mmap, self._term_records_offset + term_index * _term_record.size)
+
+
+class InvertedIndex(_TermFile):
+	def __init__(self, file_name: Union[str, Path], posting_list_cache_size: int = 1024):
+		super().__init__(file_name, _inverted_index_magic, "boolean search index")
+		self._all_pages_posting_list: Optional[PostingList] = None
+		# Frequent query terms keep their decoded posting lists
+		self._get_cached_posting_list = lru_cache(maxsize = posting_list_cache_size)(self._read_posting_list)
+
+	def get_all_pages_posting_list(self) -> PostingList:
+		if self._all_pages_posting_list is None:
+			self._all_pages_posting_list = PostingList.from_sorted(self.get_all_page_ids(), self.get_universe_size())
+		return self._all_pages_posting_list
+
+	def get_posting_list(self, term: str) -> PostingList:
+		return self._get_cached_posting_list(term)
+
+	def get_page_ids(self, term: str) -> List[int]:
+		postings = self._find_postings(term)
+		return [] if postings is None else decode_postings(self._mmap, *postings)
+
+	def close(self) -> None:
+		self._get_cached_posting_list.cache_clear()
+		super().close()
+
+	def _read_posting_list(self, term: str) -> PostingList:
+		return PostingList.from_sorted(self.get_page_ids(term), self.get_universe_size())
+
+
+class PositionalIndex(_TermFile):
+	def __init__(self, file_name: Union[str, Path]):
+		super().__init__(file_name, _positional_index_magic, "positional index")
+
+	def get_positions(self, term: str, page_ids: Optional[Collection[int]] = None) -> Dict[int, List[int]]:
+		postings = self._find_postings(term)
+		if postings is None:
+			return {}
+
+		page_positions: Dict[int, List[int]] = {}
+		position, end = postings
+		page_id = 0
+		while position < end:
+			page_id_gap, position = decode_varint(self._mmap, position)
+			positions_size, position = decode_varint(self._mmap, position)
+			page_id += page_id_gap
+			# Positions of the pages that are not asked for are skipped without decoding
+			if page_ids is None or page_id in page_ids:
+				page_positions[page_id] = decode_postings(self._mmap, position, position + positions_size)
+			position += positions_size
+		return page_positions
+
+
+def _write_term_file(
+		file_name: Union[str, Path],
+		magic: bytes,
+		postings: Mapping[str, Tuple[bytes, int]],
+		page_ids: Iterable[int]):
+	# Terms are sorted by their UTF-8 bytes, the same order the reader's binary search compares them in
+	encoded_terms = sorted((term.encode("utf-8"), term) for term in postings)
+	sorted_page_ids = array("I", sorted(page_ids))
+
+	term_bytes = bytearray()
+	term_records = bytearray()
+	postings_bytes = bytearray()
+	for encoded_term, term in encoded_terms:
+		encoded_postings, document_frequency = postings[term]
+		term_records += _term_record.pack(
+			len(term_bytes),
+			len(encoded_term),
+			len(postings_bytes),
+			len(encoded_postings),
+			document_frequency)
+		term_bytes += encoded_term
+		postings_bytes += encoded_postings
+
+	if sys.byteorder == "big":
+		sorted_page_ids.byteswap()
+
+	with atomic_write(file_name) as index_file:
+		index_file.write(
+			_header.pack(magic, inverted_index_format_version, len(sorted_page_ids), len(encoded_terms), len(term_bytes)))
+		index_file.write(sorted_page_ids.tobytes())
+		index_file.write(term_records)
+		index_file.write(term_bytes)
+		index_file.write(postings_bytes)
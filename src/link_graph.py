@@ -0,0 +1,86 @@
+from pathlib import Path
+import struct
+from typing import Dict, Iterable, List, Mapping, Optional, Union
+
+import numpy
+from numpy.typing import NDArray
+
+from file_io import MappedFile, write_aligned_sections
+
+link_graph_format_version = 1
+
+# Header: magic, format version, flags, page count, link count
+_header = struct.Struct("<4sIIIQ")
+_link_graph_magic = b"LGRF"
+_has_income_links_flag = 1
+
+_page_id_type = numpy.dtype("<u4")
+_offset_type = numpy.dtype("<u8")
+
+
+def write_link_graph(
+		file_name: Union[str, Path],
+		outcome_links: Mapping[int, Iterable[int]],
+		with_income_links: bool = True) -> None:
+	# Links point to page indexes, positions in the sorted page id array, so the graph is a CSR matrix as is
+	page_outcome_links = {page_id: list(links) for page_id, links in outcome_links.items()}
+	page_ids = numpy.array(
+		sorted(set(page_outcome_links).union(*page_outcome_links.values())),
+		_page_id_type)
+	page_indexes = {page_id: page_index for page_index, page_id in enumerate(page_ids.tolist())}
+
+	outcome_link_counts = numpy.zeros(len(page_ids), numpy.int64)
+	for page_id, links in page_outcome_links.items():
+		outcome_link_counts[page_indexes[page_id]] = len(links)
+	offsets = numpy.concatenate(([0], numpy.cumsum(outcome_link_counts)))
+
+	targets = numpy.empty(offsets[-1], _page_id_type)
+	for page_id, links in page_outcome_links.items():
+		start = offsets[page_indexes[page_id]]
+		targets[start:start + len(links)] = [page_indexes[link] for link in links]
+
+	sections = [page_ids.tobytes(), offsets.astype(_offset_type).tobytes(), targets.tobytes()]
+	flags = 0
+	if with_income_links:
+		# Income links are the same matrix stored by target
+		sources = numpy.repeat(numpy.arange(len(page_ids), dtype = _page_id_type), outcome_link_counts)
+		income_order = numpy.argsort(targets, kind = "stable")
+		income_offsets = numpy.concatenate(([0], numpy.cumsum(numpy.bincount(targets, minlength = len(page_ids)))))
+		sections += [income_offsets.astype(_offset_type).tobytes(), sources[income_order].tobytes()]
+		flags |= _has_income_links_flag
+
+	header = _header.pack(_link_graph_magic, link_graph_format_version, flags, len(page_ids), len(targets))
+	write_aligned_sections(file_name, header, sections)
+
+
+class LinkGraph(MappedFile):
+	def __init__(self, file_name: Union[str, Path]):
+		super().__init__(file_name, _header, _link_graph_magic, link_graph_format_version, "link graph")
+		flags, page_count, link_count = self._header_values
+
+		# Arrays are read-only views of the mapped file, loading a graph allocates nothing per link
+		self.page_ids = self._read_array(_page_id_type, page_count)
+		self.offsets = self._read_array(_offset_type, page_count + 1)
+		self.targets = self._read_array(_page_id_type, link_count)
+		self.income_offsets: Optional[NDArray[numpy.uint64]] = None
+		self.sources: Optional[NDArray[numpy.uint32]] = None
+		if flags & _has_income_links_flag:
+			self.income_offsets = self._read_array(_offset_type, page_count + 1)
+			self.sources = self._read_array(_page_id_type, link_count)
+
+	def __len__(self) -> int:
+		return len(self.page_ids)
+
+	def get_link_count(self) -> int:
+		return len(self.targets)
+
+	def has_income_links(self) -> bool:
+		return self.income_offsets is not None
+
+	def to_outcome_links(self) -> Dict[int, List[int]]:
+		page_ids = self.page_ids.tolist()
+		offsets = self.offsets.tolist()
+		targets = self.targets.tolist()
+		return {
+			page_id: [page_ids[target] for target in targets[offsets[page_index]:offsets[page_index + 1]]]
+			for page_index, page_id in enumerate(page_ids)}
@@ -0,0 +1,53 @@
+from functools import lru_cache
+import re as regex
+import string
+from typing import Iterable, Set, Tuple
+
+import pymorphy3
+
+_punctuation_characters = frozenset(string.punctuation)
+_number_pattern = regex.compile(r"^[0-9]+$")
+_russian_word_pattern = regex.compile(r"^[а-яА-Я]{2,}$")
+
+
+class TokenNormalizer:
+	def __init__(self, morph_analyzer: pymorphy3.MorphAnalyzer, stop_words: Iterable[str], cache_size: int = 100_000):
+		self._morph_analyzer = morph_analyzer
+		self._stop_words: Set[str] = set(stop_words)
+		# Token frequencies follow Zipf's law, so a bounded cache answers almost every lookup after the first pages
+		self._normalize = lru_cache(maxsize = cache_size)(self._normalize_uncached)
+
+	@property
+	def stop_words(self) -> Set[str]:
+		return self._stop_words
+
+	def normalize(self, token: str) -> Tuple[bool, str]:
+		return self._normalize(token)
+
+	def is_valid(self, token: str) -> bool:
+		return self._normalize(token)[0]
+
+	def get_lemma(self, token: str) -> str:
+		return self._normalize(token)[1]
+
+	def get_cache_info(self):
+		return self._normalize.cache_info()
+
+	def clear_cache(self) -> None:
+		self._normalize.cache_clear()
+
+	def _normalize_uncached(self, token: str) -> Tuple[bool, str]:
+		parsed_token = self._morph_analyzer.parse(token)[0]
+		lemma = parsed_token.normal_form if parsed_token.normalized.is_known else token.lower()
+
+		are_stuck_words = (
+			any(map(str.isupper, token[1:]))
+			and (any(map(str.islower, token[1:])) or token[:1].islower()))
+		is_valid = (
+			_russian_word_pattern.match(token) is not None
+			and _number_pattern.match(token) is None
+			and not any(character in _punctuation_characters for character in token)
+			and token.lower() not in self._stop_words
+			and not are_stuck_words
+			and parsed_token.score >= 0.5)
+		return is_valid, lemma
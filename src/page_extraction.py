@@ -0,0 +1,113 @@
+from html.parser import HTMLParser
+from typing import Dict, List, Mapping, Optional, Tuple
+
+from text import delete_extra_whitespaces
+
+try:
+	from lxml import etree as lxml_etree # pyright: ignore
+except ImportError:
+	lxml_etree = None
+
+_hidden_text_tags = {"script", "style", "template"}
+
+
+class ExtractedPage:
+	def __init__(self, link_hrefs: List[str], text_parts: List[str]):
+		self.link_hrefs = link_hrefs
+		self._text_parts = text_parts
+
+	def get_text(self) -> str:
+		return delete_extra_whitespaces(" ".join(self._text_parts))
+
+	def count_words(self) -> int:
+		# Text parts are joined with spaces, so no word spans two parts
+		return sum(len(text_part.split()) for text_part in self._text_parts)
+
+
+def is_lxml_available() -> bool:
+	return lxml_etree is not None
+
+
+def extract_page(markup: str, parser: str = "html.parser") -> ExtractedPage:
+	collector = _PageContentCollector()
+	if parser == "lxml" and lxml_etree is not None:
+		lxml_parser = lxml_etree.HTMLParser(target = _LxmlTargetAdapter(collector)) # pyright: ignore
+		lxml_parser.feed(markup) # pyright: ignore
+		lxml_parser.close() # pyright: ignore
+	elif parser in ["html.parser", "lxml"]:
+		html_parser = _HtmlParserAdapter(collector)
+		html_parser.feed(markup)
+		html_parser.close()
+	else:
+		raise ValueError("Unknown parser: " + parser)
+
+	return ExtractedPage(collector.link_hrefs, collector.text_parts)
+
+
+class _PageContentCollector:
+	def __init__(self):
+		self.link_hrefs: List[str] = []
+		self.text_parts: List[str] = []
+		self._is_body_seen = False
+		self._is_in_body = False
+		self._hidden_text_depth = 0
+
+	def start(self, tag: str, attributes: Mapping[str, Optional[str]]):
+		if tag in _hidden_text_tags:
+			self._hidden_text_depth += 1
+		elif tag == "body" and not self._is_body_seen:
+			# Only links of the first body count, the same as BeautifulSoup's "body" lookup
+			self._is_body_seen = True
+			self._is_in_body = True
+		elif tag == "a" and self._is_in_body:
+			self.link_hrefs.append(attributes.get("href") or "")
+
+	def end(self, tag: str):
+		if tag in _hidden_text_tags:
+			self._hidden_text_depth = max(self._hidden_text_depth - 1, 0)
+		elif tag == "body":
+			self._is_in_body = False
+
+	def data(self, text: str):
+		if self._hidden_text_depth == 0:
+			self.text_parts.append(text)
+
+
+class _HtmlParserAdapter(HTMLParser):
+	def __init__(self, collector: _PageContentCollector):
+		super().__init__(convert_charrefs = True)
+		self._collector = collector
+
+	def handle_starttag(self, tag: str, attrs: List[Tuple[str, Optional[str]]]):
+		self._collector.start(tag, dict(attrs))
+
+	def handle_startendtag(self, tag: str, attrs: List[Tuple[str, Optional[str]]]):
+		self._collector.start(tag, dict(attrs))
+		self._collector.end(tag)
+
+	def handle_endtag(self, tag: str):
+		self._collector.end(tag)
+
+	def handle_data(self, data: str):
+		self._collector.data(data)
+
+	def unknown_decl(self, data: str):
+		if data.startswith("CDATA["):
+			self._collector.data(data[len("CDATA["):])
+
+
+class _LxmlTargetAdapter:
+	def __init__(self, collector: _PageContentCollector):
+		self._collector = collector
+
+	def start(self, tag: str, attrib: Dict[str, str]):
+		self._collector.start(tag, attrib)
+
+	def end(self, tag: str):
+		self._collector.end(tag)
+
+	def data(self, data: str):
+		self._collector.data(data)
+
+	def close(self):
+		pass
@@ -1,46 +1,102 @@
-from typing import Dict, List, Optional
+import json
+import os
+from pathlib import Path
+import threading
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy
+from numpy.typing import NDArray
 
 import crawler
+from file_io import atomic_write
+from link_graph import LinkGraph
+
+page_ranks_file_name = 'raw-pages/page-ranks.json'
+page_ranks_format_version = 2
+
+_page_ranks_lock = threading.Lock()
+_cached_links_file_state: Optional[List[int]] = None
+_cached_page_ranks: Optional[Tuple[Dict[int, float], 'PageRankTelemetry']] = None
+
+
+class PageRankTelemetry:
+    def __init__(self, iteration_count: int, residuals: List[float], is_converged: bool, elapsed_seconds: float):
+        self.iteration_count = iteration_count
+        self.residuals = residuals
+        self.is_converged = is_converged
+        self.elapsed_seconds = elapsed_seconds
 
 
-def convert_to_income_links(outcome_links: Dict[int, List[int]]) -> Dict[int, List[int]]:
-    income_links: Dict[int, List[int]] = {}
+def create_link_matrix(
+        outcome_links: Dict[int, List[int]]
+    ) -> Tuple[NDArray[numpy.int64], NDArray[numpy.int64], NDArray[numpy.int32]]:
+    # Pages that only appear as link targets get rows too, they are the dangling pages
+    page_ids = numpy.array(sorted(set(outcome_links).union(*outcome_links.values())), numpy.int64)
+    page_indexes = {page_id: page_index for page_index, page_id in enumerate(page_ids.tolist())}
+
+    offsets = numpy.zeros(len(page_ids) + 1, numpy.int64)
     for page_id, page_outcome_links in outcome_links.items():
-        for target_page_id in page_outcome_links:
-            income_links.setdefault(target_page_id, [])
-            income_links[target_page_id].append(page_id)
-    return income_links
+        offsets[page_indexes[page_id] + 1] = len(page_outcome_links)
+    numpy.cumsum(offsets, out=offsets)
 
+    targets = numpy.empty(offsets[-1], numpy.int32)
+    for page_id, page_outcome_links in outcome_links.items():
+        start = offsets[page_indexes[page_id]]
+        targets[start:start + len(page_outcome_links)] = [page_indexes[target_id] for target_id in page_outcome_links]
 
-def calculate_page_rank(
-        outcome_links: Dict[int, List[int]],
-        income_links: Dict[int, List[int]],
-        threshold: float = 0.000001
-    ) -> Dict[int, float]:
-    page_count = len(income_links)
-    initial_page_rank_value = 1 / page_count
-    previous_page_ranks = {page_id: initial_page_rank_value for page_id in income_links}
-
-    while True:
-        page_rank_contributions = {page_id: page_rank / len(outcome_links[page_id])
-            for page_id, page_rank in previous_page_ranks.items()}
-
-        max_page_rank_delta: Optional[float] = None
-        current_page_ranks: Dict[int, float] = {}
-        for page_id, page_income_links in income_links.items():
-            page_rank = sum(page_rank_contributions[source_page_id] for source_page_id in page_income_links)
-            current_page_ranks[page_id] = page_rank
-
-            page_rank_delta = abs(page_rank - previous_page_ranks[page_id])
-            max_page_rank_delta = (page_rank_delta
-                if max_page_rank_delta is None
-                else max(max_page_rank_delta, page_rank_delta))
-
-        previous_page_ranks = current_page_ranks
-        if max_page_rank_delta < threshold:
+    return page_ids, offsets, targets
+
+
+def calculate_page_rank_vector(
+        offsets: NDArray[numpy.integer[Any]],
+        targets: NDArray[numpy.integer[Any]],
+        damping_factor: float = 0.85,
+        threshold: float = 0.000001,
+        max_iterations: int = 100
+    ) -> Tuple[NDArray[numpy.float64], PageRankTelemetry]:
+    start_time = time.perf_counter()
+    page_count = len(offsets) - 1
+    if page_count == 0:
+        return numpy.empty(0, numpy.float64), PageRankTelemetry(0, [], True, 0)
+
+    # Power iteration over the CSR link matrix: every page spreads its rank over its outcome links, the rank
+    # of the dangling pages is spread over all pages, and the damping factor adds the random jumps
+    outcome_link_counts = numpy.diff(offsets)
+    sources = numpy.repeat(numpy.arange(page_count, dtype=numpy.int32), outcome_link_counts)
+    is_dangling = outcome_link_counts == 0
+    link_weights = 1 / numpy.maximum(outcome_link_counts, 1)
+
+    page_ranks = numpy.full(page_count, 1 / page_count)
+    residuals: List[float] = []
+    is_converged = False
+    while len(residuals) < max_iterations:
+        linked_page_ranks = numpy.bincount(
+            targets,
+            weights=(page_ranks * link_weights)[sources],
+            minlength=page_count)
+        dangling_page_rank = page_ranks[is_dangling].sum()
+        current_page_ranks = damping_factor * (linked_page_ranks + dangling_page_rank / page_count) \
+            + (1 - damping_factor) / page_count
+
+        residuals.append(float(numpy.abs(current_page_ranks - page_ranks).sum()))
+        page_ranks = current_page_ranks
+        if residuals[-1] < threshold:
+            is_converged = True
             break
 
-    return previous_page_ranks
+    return page_ranks, PageRankTelemetry(len(residuals), residuals, is_converged, time.perf_counter() - start_time)
+
+
+def calculate_page_rank(
+        outcome_links: Dict[int, List[int]],
+        damping_factor: float = 0.85,
+        threshold: float = 0.000001,
+        max_iterations: int = 100
+    ) -> Tuple[Dict[int, float], PageRankTelemetry]:
+    page_ids, offsets, targets = create_link_matrix(outcome_links)
+    page_ranks, telemetry = calculate_page_rank_vector(offsets, targets, damping_factor, threshold, max_iterations)
+    return dict(zip(page_ids.tolist(), page_ranks.tolist())), telemetry
 
 
 def filter_self_loop_links(links: Dict[int, List[int]]):
@@ -51,8 +107,91 @@ def filter_self_loop_links(links: Dict[int, List[int]]):
             pass
 
 
-def get_page_rank():
+def filter_self_loop_link_arrays(
+        offsets: NDArray[numpy.integer[Any]],
+        targets: NDArray[numpy.integer[Any]]
+    ) -> Tuple[NDArray[numpy.int64], NDArray[numpy.int64]]:
+    sources = numpy.repeat(numpy.arange(len(offsets) - 1), numpy.diff(offsets.astype(numpy.int64)))
+    is_kept = targets != sources
+    kept_link_counts = numpy.bincount(sources[is_kept], minlength=len(offsets) - 1)
+    return numpy.concatenate(([0], numpy.cumsum(kept_link_counts))), targets[is_kept].astype(numpy.int64)
+
+
+def calculate_links_page_rank() -> Tuple[Dict[int, float], PageRankTelemetry]:
+    if crawler.get_links_file_name() == crawler.links_file_name:
+        # The graph file already is a CSR matrix, its arrays are used without building any links in Python
+        with LinkGraph(crawler.links_file_name) as link_graph:
+            offsets, targets = filter_self_loop_link_arrays(link_graph.offsets, link_graph.targets)
+            page_ranks, telemetry = calculate_page_rank_vector(offsets, targets)
+            return dict(zip(link_graph.page_ids.tolist(), page_ranks.tolist())), telemetry
+
     outcome_links = crawler.read_page_outcome_links()
     filter_self_loop_links(outcome_links)
-    income_links = convert_to_income_links(outcome_links)
-    return calculate_page_rank(outcome_links, income_links)
+    return calculate_page_rank(outcome_links)
+
+
+def get_links_file_state() -> List[int]:
+    links_file_stat = os.stat(crawler.get_links_file_name() or crawler.links_file_name)
+    return [links_file_stat.st_mtime_ns, links_file_stat.st_size]
+
+
+def save_page_ranks(page_ranks: Dict[int, float], telemetry: PageRankTelemetry, links_file_state: List[int]) -> None:
+    serialized_page_ranks = {
+        'version': page_ranks_format_version,
+        'links_file_state': links_file_state,
+        'telemetry': {
+            'iteration_count': telemetry.iteration_count,
+            'residuals': telemetry.residuals,
+            'is_converged': telemetry.is_converged,
+            'elapsed_seconds': telemetry.elapsed_seconds},
+        'page_ranks': {str(page_id): page_rank for page_id, page_rank in page_ranks.items()}
+    }
+
+    with atomic_write(page_ranks_file_name, 'w', 'utf-8') as file:
+        json.dump(serialized_page_ranks, file)
+
+
+def read_page_ranks(links_file_state: List[int]) -> Optional[Tuple[Dict[int, float], PageRankTelemetry]]:
+    if not Path(page_ranks_file_name).is_file():
+        return None
+
+    with open(page_ranks_file_name, 'r', encoding = 'utf-8') as file:
+        serialized_page_ranks = json.load(file)
+    # Page ranks of another links file or of another calculation are calculated again
+    if serialized_page_ranks.get('version') != page_ranks_format_version \
+            or serialized_page_ranks.get('links_file_state') != links_file_state:
+        return None
+
+    serialized_telemetry = serialized_page_ranks['telemetry']
+    telemetry = PageRankTelemetry(
+        serialized_telemetry['iteration_count'],
+        serialized_telemetry['residuals'],
+        serialized_telemetry['is_converged'],
+        serialized_telemetry['elapsed_seconds'])
+    page_ranks = {int(page_id): page_rank for page_id, page_rank in serialized_page_ranks['page_ranks'].items()}
+    return page_ranks, telemetry
+
+
+def get_page_rank_with_telemetry() -> Tuple[Dict[int, float], PageRankTelemetry]:
+    global _cached_links_file_state, _cached_page_ranks
+
+    # Page ranks are calculated once per links file: a crawl that rewrites it changes its state
+    links_file_state = get_links_file_state()
+    with _page_ranks_lock:
+        if _cached_page_ranks is None or _cached_links_file_state != links_file_state:
+            page_ranks = read_page_ranks(links_file_state)
+            if page_ranks is None:
+                page_ranks = calculate_links_page_rank()
+                save_page_ranks(*page_ranks, links_file_state)
+            _cached_links_file_state = links_file_state
+            _cached_page_ranks = page_ranks
+
+        return _cached_page_ranks
+
+
+def get_page_rank() -> Dict[int, float]:
+    return get_page_rank_with_telemetry()[0]
+
+
+def get_page_rank_score(page_id: int) -> float:
+    return get_page_rank().get(page_id, 0.0)
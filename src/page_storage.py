@@ -0,0 +1,308 @@
+import io
+import json
+import os
+from pathlib import Path
+import shutil
+import struct
+import threading
+from typing import BinaryIO, Callable, Dict, Iterator, List, Optional, Tuple, Union
+import zlib
+
+try:
+	import zstandard # pyright: ignore
+except ImportError:
+	zstandard = None
+
+
+class PageFileStorage:
+	def __init__(self, pages_path: Path, file_encoding: str = "utf-8", read_only: bool = False):
+		self._pages_path = pages_path
+		self._read_only = read_only
+		if not read_only:
+			self._pages_path.mkdir(parents = True, exist_ok = True)
+		self._file_encoding = file_encoding
+
+	def write(self, id_: int, markup: str) -> None:
+		self.write_many([(id_, markup)])
+
+	def write_many(self, pages: List[Tuple[int, str]], fsync: bool = False) -> None:
+		_ensure_writable(self._read_only)
+		for id_, markup in pages:
+			with open(self._get_page_full_file_name(id_), "w", encoding = self._file_encoding) as file:
+				file.write(markup)
+				if fsync:
+					file.flush()
+					os.fsync(file.fileno())
+
+	def read(self, id_: int) -> str:
+		with open(self._get_page_full_file_name(id_), "r", encoding = self._file_encoding) as file:
+			return file.read()
+
+	def contains(self, id_: int) -> bool:
+		return self._get_page_full_file_name(id_).is_file()
+
+	def get_stamp(self, id_: int) -> Optional[str]:
+		try:
+			page_file_status = self._get_page_full_file_name(id_).stat()
+		except FileNotFoundError:
+			return None
+		return f"{page_file_status.st_mtime_ns}:{page_file_status.st_size}"
+
+	def scan(self) -> Iterator[Tuple[int, str]]:
+		if not self._pages_path.is_dir():
+			return
+		for page_full_file_name in self._pages_path.iterdir():
+			if page_full_file_name.suffix == ".txt" and page_full_file_name.stem.isdigit():
+				yield int(page_full_file_name.stem), self.read(int(page_full_file_name.stem))
+
+	def delete_all(self) -> None:
+		_ensure_writable(self._read_only)
+		shutil.rmtree(self._pages_path, ignore_errors = True)
+		self._pages_path.mkdir(parents = True, exist_ok = True)
+
+	def close(self) -> None:
+		pass
+
+	def _get_page_full_file_name(self, id_: int) -> Path:
+		return self._pages_path.joinpath(f"{id_}.txt")
+
+
+class PageSegmentStorage:
+	# Segment record header: page id, compressed markup length
+	_record_header = struct.Struct("<QI")
+	# Offset table record: page id, segment number, markup offset, compressed markup length
+	_offset_record = struct.Struct("<QIQI")
+
+	def __init__(
+			self,
+			segments_path: Path,
+			file_encoding: str = "utf-8",
+			compression: str = "zlib",
+			max_segment_size: int = 64 * 1024 * 1024,
+			read_only: bool = False):
+		self._segments_path = segments_path
+		self._read_only = read_only
+		if not read_only:
+			self._segments_path.mkdir(parents = True, exist_ok = True)
+		self._file_encoding = file_encoding
+		self._max_segment_size = max_segment_size
+		self._lock = threading.Lock()
+
+		self._compression = self._initialize_format(compression)
+		self._compressor, self._decompressor = self._create_codec(self._compression)
+
+		self._offsets_file = self._open_offsets_file()
+		self._id_to_location_map: Dict[int, Tuple[int, int, int]] = {}
+		self._initialize_offsets_from_file()
+
+		self._segment_files: Dict[int, BinaryIO] = {}
+		self._current_segment_number = max(self._get_segment_numbers(), default = 0)
+
+	def write(self, id_: int, markup: str) -> None:
+		self.write_many([(id_, markup)])
+
+	def write_many(self, pages: List[Tuple[int, str]], fsync: bool = False) -> None:
+		_ensure_writable(self._read_only)
+		compressed_pages = [(id_, self._compressor(markup.encode(self._file_encoding))) for id_, markup in pages]
+		with self._lock:
+			touched_segment_files: Dict[int, BinaryIO] = {}
+			locations: List[Tuple[int, Tuple[int, int, int]]] = []
+			for id_, compressed_markup in compressed_pages:
+				segment_file = self._get_segment_file(self._current_segment_number)
+				segment_file.seek(0, os.SEEK_END)
+				if segment_file.tell() > 0 and segment_file.tell() + len(compressed_markup) > self._max_segment_size:
+					self._current_segment_number += 1
+					segment_file = self._get_segment_file(self._current_segment_number)
+				touched_segment_files[self._current_segment_number] = segment_file
+
+				record_offset = segment_file.tell()
+				segment_file.write(self._record_header.pack(id_, len(compressed_markup)))
+				segment_file.write(compressed_markup)
+				locations.append(
+					(id_, (self._current_segment_number, record_offset + self._record_header.size, len(compressed_markup))))
+
+			# Records must be in the segments before the offset table points to them
+			for segment_file in touched_segment_files.values():
+				segment_file.flush()
+				if fsync:
+					os.fsync(segment_file.fileno())
+
+			for id_, location in locations:
+				self._offsets_file.write(self._offset_record.pack(id_, *location))
+				self._id_to_location_map[id_] = location
+			self._offsets_file.flush()
+			if fsync:
+				os.fsync(self._offsets_file.fileno())
+
+	def read(self, id_: int) -> str:
+		with self._lock:
+			location = self._id_to_location_map.get(id_)
+			if location is None:
+				raise KeyError(f"Page {id_} is not found")
+
+			segment_number, offset, length = location
+			segment_file = self._get_segment_file(segment_number)
+			segment_file.seek(offset)
+			compressed_markup = segment_file.read(length)
+
+		return self._decompressor(compressed_markup).decode(self._file_encoding)
+
+	def contains(self, id_: int) -> bool:
+		return id_ in self._id_to_location_map
+
+	def get_stamp(self, id_: int) -> Optional[str]:
+		# Every write appends a new record, so the location of a page changes whenever the page does
+		location = self._id_to_location_map.get(id_)
+		return None if location is None else ":".join(map(str, location))
+
+	def scan(self) -> Iterator[Tuple[int, str]]:
+		# The offset table is walked in segment order, so records replaced by later writes are skipped
+		# and the segments are still read front to back
+		with self._lock:
+			locations = sorted((location, id_) for id_, location in self._id_to_location_map.items())
+
+		segment_file: Optional[BinaryIO] = None
+		segment_file_number = -1
+		try:
+			for (segment_number, offset, length), id_ in locations:
+				if segment_file is None or segment_file_number != segment_number:
+					if segment_file is not None:
+						segment_file.close()
+					segment_file = open(self._get_segment_full_file_name(segment_number), "rb")
+					segment_file_number = segment_number
+				segment_file.seek(offset)
+				yield id_, self._decompressor(segment_file.read(length)).decode(self._file_encoding)
+		finally:
+			if segment_file is not None:
+				segment_file.close()
+
+	def delete_all(self) -> None:
+		_ensure_writable(self._read_only)
+		with self._lock:
+			self._close_segment_files()
+			self._offsets_file.truncate(0)
+			self._offsets_file.flush()
+			self._id_to_location_map = {}
+
+			for segment_number in self._get_segment_numbers():
+				self._get_segment_full_file_name(segment_number).unlink()
+			self._current_segment_number = 0
+
+	def close(self) -> None:
+		with self._lock:
+			self._close_segment_files()
+			self._offsets_file.close()
+
+	def _initialize_format(self, compression: str) -> str:
+		# The compression is chosen when the storage is created and kept for its lifetime
+		format_full_file_name = self._segments_path.joinpath("format.json")
+		if format_full_file_name.is_file():
+			with open(format_full_file_name, "r", encoding = "utf-8") as format_file:
+				return str(json.load(format_file)["compression"])
+		if self._read_only:
+			return compression
+
+		with open(format_full_file_name, "w", encoding = "utf-8") as format_file:
+			json.dump({"compression": compression}, format_file)
+		return compression
+
+	def _open_offsets_file(self) -> BinaryIO:
+		offsets_full_file_name = self._segments_path.joinpath("offsets.bin")
+		if not self._read_only:
+			return open(offsets_full_file_name, "a+b")
+		if not offsets_full_file_name.is_file():
+			return io.BytesIO()
+		return open(offsets_full_file_name, "rb")
+
+	def _initialize_offsets_from_file(self):
+		self._offsets_file.seek(0)
+		offsets = self._offsets_file.read()
+
+		# A record torn by a crash is dropped, its page is not in the index either.
+		# A reader only skips it, the writer may be appending it right now
+		complete_offsets_size = len(offsets) - len(offsets) % self._offset_record.size
+		if complete_offsets_size != len(offsets) and not self._read_only:
+			self._offsets_file.truncate(complete_offsets_size)
+
+		self._id_to_location_map = {}
+		for id_, segment_number, offset, length in self._offset_record.iter_unpack(offsets[:complete_offsets_size]):
+			self._id_to_location_map[id_] = (segment_number, offset, length)
+
+		if not self._read_only:
+			self._truncate_unreferenced_segment_tails()
+
+	def _truncate_unreferenced_segment_tails(self):
+		# A crash can leave a torn or unreferenced record at the end of a segment; new records would be
+		# appended after it, so every segment is cut back to the end of its last record in the offset table
+		segment_ends: Dict[int, int] = {}
+		for segment_number, offset, length in self._id_to_location_map.values():
+			segment_ends[segment_number] = max(segment_ends.get(segment_number, 0), offset + length)
+
+		for segment_number in self._get_segment_numbers():
+			segment_full_file_name = self._get_segment_full_file_name(segment_number)
+			segment_end = segment_ends.get(segment_number, 0)
+			if segment_full_file_name.stat().st_size > segment_end:
+				with open(segment_full_file_name, "r+b") as segment_file:
+					segment_file.truncate(segment_end)
+
+	def _get_segment_file(self, segment_number: int) -> BinaryIO:
+		segment_file = self._segment_files.get(segment_number)
+		if segment_file is None:
+			segment_file = open(self._get_segment_full_file_name(segment_number), "rb" if self._read_only else "a+b")
+			self._segment_files[segment_number] = segment_file
+
+		return segment_file
+
+	def _close_segment_files(self):
+		for segment_file in self._segment_files.values():
+			segment_file.close()
+		self._segment_files = {}
+
+	def _get_segment_numbers(self) -> Iterator[int]:
+		if not self._segments_path.is_dir():
+			return
+		for segment_full_file_name in self._segments_path.glob("*.seg"):
+			if segment_full_file_name.stem.isdigit():
+				yield int(segment_full_file_name.stem)
+
+	def _get_segment_full_file_name(self, segment_number: int) -> Path:
+		return self._segments_path.joinpath(f"{segment_number:06}.seg")
+
+	@staticmethod
+	def _create_codec(compression: str) -> Tuple[Callable[[bytes], bytes], Callable[[bytes], bytes]]:
+		if compression == "zlib":
+			return (lambda data: zlib.compress(data, 6)), zlib.decompress
+		if compression == "zstd":
+			if zstandard is None:
+				raise ValueError("zstd compression requires the zstandard package")
+			compressor = zstandard.ZstdCompressor(level = 3) # pyright: ignore
+			decompressor = zstandard.ZstdDecompressor() # pyright: ignore
+			return compressor.compress, decompressor.decompress # pyright: ignore
+		if compression == "none":
+			return bytes, bytes
+
+		raise ValueError("Unknown compression: " + compression)
+
+
+def create_page_storage(
+		repository_path: Path,
+		storage: Optional[str],
+		file_encoding: str,
+		compression: Optional[str] = None,
+		read_only: bool = False) -> Union[PageFileStorage, PageSegmentStorage]:
+	if storage is None:
+		storage = "segments" if repository_path.joinpath("segments", "format.json").is_file() else "files"
+
+	if storage == "files":
+		return PageFileStorage(repository_path.joinpath("pages"), file_encoding, read_only)
+	if storage == "segments":
+		if compression is None:
+			compression = "zstd" if zstandard is not None else "zlib"
+		return PageSegmentStorage(repository_path.joinpath("segments"), file_encoding, compression, read_only = read_only)
+
+	raise ValueError("Unknown page storage: " + storage)
+
+
+def _ensure_writable(read_only: bool):
+	if read_only:
+		raise io.UnsupportedOperation("The page storage is opened read-only")
@@ -0,0 +1,179 @@
+from array import array
+from bisect import bisect_left
+from typing import Iterable, Iterator, List, Optional, Tuple
+
+# A sorted array takes 32 bits per page and a bitmap takes 1 bit per page of the whole corpus,
+# so a list switches to a bitmap once more than 1/32 of the pages are in it
+_bitmap_density = 32
+_byte_bit_positions: List[Tuple[int, ...]] = [
+	tuple(bit for bit in range(8) if byte >> bit & 1) for byte in range(256)]
+
+
+class PostingList:
+	def __init__(self, universe_size: int, page_ids: Optional["array[int]"] = None, bitmap: Optional[int] = None):
+		self.universe_size = universe_size
+		self._page_ids = page_ids
+		self._bitmap = bitmap
+		self._bitmap_bytes: Optional[bytes] = None
+		self._length: Optional[int] = None if page_ids is None else len(page_ids)
+
+	@staticmethod
+	def from_sorted(page_ids: Iterable[int], universe_size: int) -> "PostingList":
+		return PostingList._create(array("I", page_ids), universe_size)
+
+	@staticmethod
+	def empty(universe_size: int) -> "PostingList":
+		return PostingList(universe_size, page_ids = array("I"))
+
+	def is_bitmap(self) -> bool:
+		return self._bitmap is not None
+
+	def __len__(self) -> int:
+		if self._length is None:
+			assert self._bitmap is not None
+			self._length = self._bitmap.bit_count()
+		return self._length
+
+	def __bool__(self) -> bool:
+		return self._bitmap != 0 if self._bitmap is not None else len(self) > 0
+
+	def __iter__(self) -> Iterator[int]:
+		if self._page_ids is not None:
+			return iter(self._page_ids)
+		return iter(self._get_bitmap_page_ids())
+
+	def __contains__(self, page_id: int) -> bool:
+		if self._page_ids is not None:
+			index = bisect_left(self._page_ids, page_id)
+			return index < len(self._page_ids) and self._page_ids[index] == page_id
+		if page_id < 0 or page_id >= self.universe_size:
+			return False
+		bitmap_bytes = self._get_bitmap_bytes()
+		return bitmap_bytes[page_id >> 3] >> (page_id & 7) & 1 == 1
+
+	def __eq__(self, other: object) -> bool:
+		if not isinstance(other, PostingList):
+			return NotImplemented
+		return self.to_list() == other.to_list()
+
+	def to_list(self) -> List[int]:
+		return list(self)
+
+	def __and__(self, other: "PostingList") -> "PostingList":
+		universe_size = max(self.universe_size, other.universe_size)
+		if self._bitmap is not None and other._bitmap is not None:
+			return PostingList._create_from_bitmap(self._bitmap & other._bitmap, universe_size)
+		if self._page_ids is not None and other._page_ids is not None:
+			return PostingList._create(_intersect_sorted(self._page_ids, other._page_ids), universe_size)
+
+		# A sorted array against a bitmap: each page of the array is looked up in the bitmap
+		page_ids, bitmap_list = (self._page_ids, other) if self._page_ids is not None else (other._page_ids, self)
+		assert page_ids is not None
+		return PostingList._create(bitmap_list._filter(page_ids, True), universe_size)
+
+	def __or__(self, other: "PostingList") -> "PostingList":
+		universe_size = max(self.universe_size, other.universe_size)
+		if self._page_ids is not None and other._page_ids is not None:
+			return PostingList._create(_unite_sorted(self._page_ids, other._page_ids), universe_size)
+		return PostingList._create_from_bitmap(self._get_bitmap() | other._get_bitmap(), universe_size)
+
+	def __sub__(self, other: "PostingList") -> "PostingList":
+		universe_size = max(self.universe_size, other.universe_size)
+		if self._page_ids is not None:
+			if other._page_ids is not None:
+				return PostingList._create(_subtract_sorted(self._page_ids, other._page_ids), universe_size)
+			return PostingList._create(other._filter(self._page_ids, False), universe_size)
+
+		assert self._bitmap is not None
+		return PostingList._create_from_bitmap(self._bitmap & ~other._get_bitmap(), universe_size)
+
+	def _filter(self, page_ids: "array[int]", is_contained: bool) -> "array[int]":
+		bitmap_bytes = self._get_bitmap_bytes()
+		bitmap_size = len(bitmap_bytes) * 8
+		return array("I", [
+			id_
+			for id_ in page_ids
+			if (id_ < bitmap_size and bitmap_bytes[id_ >> 3] >> (id_ & 7) & 1 == 1) == is_contained])
+
+	def _get_bitmap(self) -> int:
+		if self._bitmap is not None:
+			return self._bitmap
+
+		assert self._page_ids is not None
+		bitmap_bytes = bytearray((self.universe_size + 7) // 8)
+		for page_id in self._page_ids:
+			bitmap_bytes[page_id >> 3] |= 1 << (page_id & 7)
+		return int.from_bytes(bitmap_bytes, "little")
+
+	def _get_bitmap_bytes(self) -> bytes:
+		if self._bitmap_bytes is None:
+			assert self._bitmap is not None
+			self._bitmap_bytes = self._bitmap.to_bytes((self.universe_size + 7) // 8, "little")
+		return self._bitmap_bytes
+
+	def _get_bitmap_page_ids(self) -> "array[int]":
+		page_ids = array("I")
+		for byte_index, byte in enumerate(self._get_bitmap_bytes()):
+			if byte:
+				page_ids.extend(byte_index * 8 + bit for bit in _byte_bit_positions[byte])
+		return page_ids
+
+	@staticmethod
+	def _create(page_ids: "array[int]", universe_size: int) -> "PostingList":
+		if len(page_ids) * _bitmap_density > universe_size:
+			posting_list = PostingList(universe_size, page_ids = page_ids)
+			return PostingList(universe_size, bitmap = posting_list._get_bitmap())
+		return PostingList(universe_size, page_ids = page_ids)
+
+	@staticmethod
+	def _create_from_bitmap(bitmap: int, universe_size: int) -> "PostingList":
+		posting_list = PostingList(universe_size, bitmap = bitmap)
+		if len(posting_list) * _bitmap_density > universe_size:
+			return posting_list
+		return PostingList(universe_size, page_ids = posting_list._get_bitmap_page_ids())
+
+
+def _intersect_sorted(first: "array[int]", second: "array[int]") -> "array[int]":
+	if len(first) > len(second):
+		first, second = second, first
+
+	# The shorter list drives the search and skips ahead in the longer one with a binary search
+	result = array("I")
+	position = 0
+	for page_id in first:
+		position = bisect_left(second, page_id, position)
+		if position == len(second):
+			break
+		if second[position] == page_id:
+			result.append(page_id)
+	return result
+
+
+def _unite_sorted(first: "array[int]", second: "array[int]") -> "array[int]":
+	result = array("I")
+	first_position = 0
+	second_position = 0
+	while first_position < len(first) and second_position < len(second):
+		first_page_id = first[first_position]
+		second_page_id = second[second_position]
+		if first_page_id <= second_page_id:
+			result.append(first_page_id)
+			first_position += 1
+			if first_page_id == second_page_id:
+				second_position += 1
+		else:
+			result.append(second_page_id)
+			second_position += 1
+	result.extend(first[first_position:])
+	result.extend(second[second_position:])
+	return result
+
+
+def _subtract_sorted(first: "array[int]", second: "array[int]") -> "array[int]":
+	result = array("I")
+	position = 0
+	for page_id in first:
+		position = bisect_left(second, page_id, position)
+		if position == len(second) or second[position] != page_id:
+			result.append(page_id)
+	return result
@@ -1,12 +1,30 @@
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from contextlib import contextmanager
+import hashlib
+import io
+import json
+import os
 from pathlib import Path
-import shutil
-from typing import Dict, Optional
+from typing import Deque, Dict, Generator, Iterable, Iterator, List, Optional, TextIO, Tuple
+
+from file_io import atomic_write
+from page_storage import create_page_storage
 
 
 class NewRawPage:
-	def __init__(self, url: Optional[str] = None, markup: Optional[str] = None):
+	def __init__(
+			self,
+			url: Optional[str] = None,
+			markup: Optional[str] = None,
+			etag: Optional[str] = None,
+			last_modified: Optional[str] = None,
+			simhash: Optional[int] = None):
 		self.url = url
 		self.markup = markup
+		self.etag = etag
+		self.last_modified = last_modified
+		self.simhash = simhash
 
 
 class RawPage:
@@ -16,65 +34,382 @@ class RawPage:
 		self.markup = markup
 
 
+class RawPageMetadata:
+	def __init__(
+			self,
+			etag: Optional[str],
+			last_modified: Optional[str],
+			content_hash: str,
+			simhash: Optional[int] = None):
+		self.etag = etag
+		self.last_modified = last_modified
+		self.content_hash = content_hash
+		self.simhash = simhash
+
+
+durability_levels = ["none", "flush", "fsync"]
+manifest_version = 1
+
+
+def get_content_hash(markup: str) -> str:
+	return hashlib.sha256(markup.encode("utf-8")).hexdigest()
+
+
 class RawPageRepository:
-	def __init__(self, name: str = "raw-pages", file_encoding: str = "utf-8"):
-		repository_path = Path(name)
+	def __init__(
+			self,
+			name: str = "raw-pages",
+			file_encoding: str = "utf-8",
+			storage: Optional[str] = None,
+			compression: Optional[str] = None,
+			durability: str = "flush",
+			read_only: bool = False):
+		if durability not in durability_levels:
+			raise ValueError("Unknown durability: " + durability)
+		# A read-only repository never repairs or rewrites its files, so readers can open it while it is written
+		self._read_only = read_only
+		self._repository_path = Path(name)
+		if not read_only:
+			self._repository_path.mkdir(parents = True, exist_ok = True)
 
-		self._pages_path = repository_path.joinpath("pages")
-		self._pages_path.mkdir(parents = True, exist_ok = True)
+		self._page_storage = create_page_storage(self._repository_path, storage, file_encoding, compression, read_only)
 
 		self._file_encoding = file_encoding
-		self._index_full_file_name = repository_path.joinpath("index.txt")
-		self._index_file = open(
-			self._index_full_file_name,
-			"a+",
-			encoding = self._file_encoding)
+		self._index_full_file_name = self._repository_path.joinpath("index.txt")
+		self._index_file = self._open_file(self._index_full_file_name)
+
+		self._manifest_full_file_name = self._repository_path.joinpath("manifest.json")
+		self._is_manifest_stale = False
 
 		self._id_to_url_map: Dict[int, str] = {}
-		self._initialize_index_from_file(True)
+		self._initialize_index_from_file(self._read_verified_index_size())
 
 		self._max_id = max(self._id_to_url_map.keys(), default = -1)
 
+		self._metadata_full_file_name = self._repository_path.joinpath("metadata.txt")
+		self._metadata_file = self._open_file(self._metadata_full_file_name)
+		# Metadata is only needed by the crawler, so it is read on the first use
+		self._id_to_metadata_map: Optional[Dict[int, RawPageMetadata]] = None
+
+		self._durability = durability
+		self._batch_durabilities: List[str] = []
+		self._pending_markups: Dict[int, str] = {}
+		self._pending_metadata_ids: List[int] = []
+		self._pending_index_ids: List[int] = []
+
 	def create(self, new_page: NewRawPage) -> RawPage:
+		self._ensure_writable()
 		page = RawPage(self._get_new_id(), str(new_page.url), str(new_page.markup))
-		page_full_file_name = self._get_page_full_file_name(page.id_)
-		with open(page_full_file_name, "w", encoding = self._file_encoding) as file:
-			file.write(page.markup)
+		self._pending_markups[page.id_] = page.markup
 
-		self._append_index_line_to_file(page.id_, page.url)
-		self._index_file.flush()
+		self._save_metadata(
+			page.id_,
+			RawPageMetadata(new_page.etag, new_page.last_modified, get_content_hash(page.markup), new_page.simhash))
 
+		self._pending_index_ids.append(page.id_)
 		self._id_to_url_map[page.id_] = page.url
+		self._commit_unless_in_batch()
 		
 		return page
 
+	def create_many(self, new_pages: List[NewRawPage], durability: Optional[str] = None) -> List[RawPage]:
+		with self.batch(durability):
+			return [self.create(new_page) for new_page in new_pages]
+
+	@contextmanager
+	def batch(self, durability: Optional[str] = None) -> Generator[None, None, None]:
+		if durability is not None and durability not in durability_levels:
+			raise ValueError("Unknown durability: " + durability)
+
+		# Writes are buffered until the outermost batch ends and then committed together
+		self._batch_durabilities.append(durability or self._durability)
+		try:
+			yield
+		finally:
+			batch_durability = self._batch_durabilities.pop()
+			if len(self._batch_durabilities) == 0:
+				self._commit(batch_durability)
+
+	def commit(self, durability: Optional[str] = None) -> None:
+		self._commit(durability or self._get_current_durability())
+		if self._is_manifest_stale:
+			self._write_manifest()
+
+	def verify(self) -> List[int]:
+		self._ensure_writable()
+		self.commit()
+
+		# Unlike opening, verification checks every indexed page in the page storage
+		missing_ids = [id_ for id_ in self._id_to_url_map if not self._page_storage.contains(id_)]
+		for id_ in missing_ids:
+			del self._id_to_url_map[id_]
+		if len(missing_ids) > 0:
+			self._recreate_index_file()
+
+		self._initialize_metadata_from_file()
+		self._write_manifest()
+		return missing_ids
+
+	def update(self, id_: int, new_page: NewRawPage) -> RawPage:
+		self._ensure_writable()
+		if id_ not in self._id_to_url_map:
+			raise KeyError(f"Page {id_} is not found")
+
+		page = RawPage(id_, self._id_to_url_map[id_], self._get_markup(id_) if new_page.markup is None else new_page.markup)
+		if new_page.markup is not None:
+			self._pending_markups[page.id_] = page.markup
+
+		simhash = new_page.simhash
+		previous_metadata = self._get_id_to_metadata_map().get(id_)
+		if simhash is None and new_page.markup is None and previous_metadata is not None:
+			simhash = previous_metadata.simhash
+		self._save_metadata(
+			page.id_,
+			RawPageMetadata(new_page.etag, new_page.last_modified, get_content_hash(page.markup), simhash))
+		self._commit_unless_in_batch()
+
+		return page
+
+	def get(self, id_: int) -> Optional[RawPage]:
+		url = self._id_to_url_map.get(id_)
+		if url is None:
+			return None
+
+		return RawPage(id_, url, self._get_markup(id_))
+
+	def get_metadata(self, id_: int, calculate_missing: bool = True) -> Optional[RawPageMetadata]:
+		if id_ not in self._id_to_url_map:
+			return None
+
+		metadata = self._get_id_to_metadata_map().get(id_)
+		if metadata is None and calculate_missing:
+			# Pages saved before metadata was introduced
+			metadata = RawPageMetadata(None, None, get_content_hash(self._get_markup(id_)))
+			if not self._read_only:
+				self._save_metadata(id_, metadata)
+				self._commit_unless_in_batch()
+
+		return metadata
+
+	def get_page_stamp(self, id_: int) -> Optional[str]:
+		# A stamp of the stored page that changes whenever the page is written, reading it does not read the page
+		if id_ not in self._id_to_url_map or id_ in self._pending_markups:
+			return None
+		return self._page_storage.get_stamp(id_)
+
+	def get_index(self) -> Dict[int, str]:
+		return dict(self._id_to_url_map)
+
+	def get_last_modified_time(self) -> float:
+		self.commit()
+		# Every create, update and delete writes the index or the metadata file
+		return max(
+			(
+				os.path.getmtime(full_file_name)
+				for full_file_name in [self._index_full_file_name, self._metadata_full_file_name]
+				if full_file_name.is_file()),
+			default = 0.0)
+
+	def iter_pages(self, ids: Optional[Iterable[int]] = None, read_ahead: int = 0) -> Iterator[RawPage]:
+		page_ids = iter(list(self._id_to_url_map) if ids is None else ids)
+		if read_ahead <= 0:
+			for id_ in page_ids:
+				page = self.get(id_)
+				if page is not None:
+					yield page
+			return
+
+		# At most read_ahead pages are read in the background while the caller processes the current one
+		with ThreadPoolExecutor(read_ahead) as executor:
+			page_reads: Deque[Future[Optional[RawPage]]] = deque()
+			for id_ in page_ids:
+				page_reads.append(executor.submit(self.get, id_))
+				if len(page_reads) > read_ahead:
+					page = page_reads.popleft().result()
+					if page is not None:
+						yield page
+
+			while len(page_reads) > 0:
+				page = page_reads.popleft().result()
+				if page is not None:
+					yield page
+
+	def scan(self) -> Iterator[RawPage]:
+		self.commit()
+		# Pages come in storage order, which is the fastest way to read the whole repository
+		for id_, markup in self._page_storage.scan():
+			url = self._id_to_url_map.get(id_)
+			if url is not None:
+				yield RawPage(id_, url, markup)
+
 	def delete_all(self):
+		self._ensure_writable()
+		self._pending_markups = {}
+		self._pending_metadata_ids = []
+		self._pending_index_ids = []
+
 		self._index_file.truncate(0)
 		self._index_file.flush()
 		self._id_to_url_map = {}
 		self._max_id = -1
 
-		shutil.rmtree(self._pages_path, ignore_errors = True)
-		self._pages_path.mkdir(parents = True, exist_ok = True)
+		self._metadata_file.truncate(0)
+		self._metadata_file.flush()
+		self._id_to_metadata_map = {}
+
+		self._page_storage.delete_all()
+		self._write_manifest()
+
+	def close(self):
+		if not self._read_only:
+			self.commit()
+			self._write_manifest()
+		self._index_file.close()
+		self._metadata_file.close()
+		self._page_storage.close()
 
 	class IndexRecord:
 		def __init__(self, id_: int, url: str):
 			self.id_ = id_
 			self.url = url
 
-	def _initialize_index_from_file(self, recreate_file_if_inconsistent: bool):
-		self._index_file.seek(0)
-		file_lines = self._index_file.readlines()
+	def _initialize_index_from_file(self, verified_index_size: int):
+		index = b""
+		if self._index_full_file_name.is_file():
+			with open(self._index_full_file_name, "rb") as index_file:
+				index = index_file.read()
 
+		# A line torn by a crash has no line break, its page is written again by the next crawl.
+		# A reader skips it without truncating, it may be a line the writer is appending right now
+		complete_index_size = index.rfind(b"\n") + 1
+		if complete_index_size != len(index) and not self._read_only:
+			self._index_file.truncate(complete_index_size)
+			self._index_file.flush()
+		if verified_index_size > complete_index_size:
+			verified_index_size = 0
+		else:
+			verified_index_size = index.rfind(b"\n", 0, verified_index_size) + 1
+
+		# Lines listed in the manifest are known to be consistent, only lines appended after it are checked
 		self._id_to_url_map = {}
-		for file_line in file_lines:
+		for file_line in index[:verified_index_size].decode(self._file_encoding).split("\n")[:-1]:
+			index_line = self._deserialize_index_record(file_line)
+			self._id_to_url_map[index_line.id_] = index_line.url
+
+		unverified_lines = index[verified_index_size:complete_index_size].decode(self._file_encoding).split("\n")[:-1]
+		is_consistent = True
+		for file_line in unverified_lines:
 			index_line = self._deserialize_index_record(file_line)
-			page_full_file_name = self._get_page_full_file_name(index_line.id_)
-			if Path(page_full_file_name).is_file():
+			if self._page_storage.contains(index_line.id_):
 				self._id_to_url_map[index_line.id_] = index_line.url
+			else:
+				is_consistent = False
 
-		if recreate_file_if_inconsistent and len(self._id_to_url_map) != len(file_lines):
+		if self._read_only:
+			return
+		if not is_consistent:
 			self._recreate_index_file()
+		if not is_consistent or len(unverified_lines) > 0:
+			self._write_manifest()
+
+	def _read_verified_index_size(self) -> int:
+		if not self._manifest_full_file_name.is_file():
+			return 0
+
+		try:
+			with open(self._manifest_full_file_name, "r", encoding = "utf-8") as manifest_file:
+				manifest = json.load(manifest_file)
+			return int(manifest["index_size"]) if manifest.get("version") == manifest_version else 0
+		except ValueError:
+			return 0
+
+	def _write_manifest(self):
+		self._index_file.flush()
+		manifest = {
+			"version": manifest_version,
+			"index_size": os.path.getsize(self._index_full_file_name)
+		}
+
+		# A lost manifest only makes the next open verify the index, so it is not synced
+		with atomic_write(self._manifest_full_file_name, "w", "utf-8", fsync = False) as manifest_file:
+			json.dump(manifest, manifest_file)
+		self._is_manifest_stale = False
+
+	def _get_id_to_metadata_map(self) -> Dict[int, RawPageMetadata]:
+		if self._id_to_metadata_map is None:
+			self._initialize_metadata_from_file()
+		assert self._id_to_metadata_map is not None
+		return self._id_to_metadata_map
+
+	def _initialize_metadata_from_file(self):
+		self._metadata_file.seek(0)
+		file_lines = self._metadata_file.readlines()
+
+		# Metadata records are appended on every update, the last record of a page wins
+		id_to_metadata_map: Dict[int, RawPageMetadata] = {}
+		for file_line in file_lines:
+			try:
+				id_, metadata = self._deserialize_metadata_record(file_line)
+			except ValueError:
+				# A record torn by a crash, the page gets its metadata recalculated
+				continue
+			if id_ in self._id_to_url_map:
+				id_to_metadata_map[id_] = metadata
+		self._id_to_metadata_map = id_to_metadata_map
+
+		if len(file_lines) > 2 * len(id_to_metadata_map) and not self._read_only:
+			self._metadata_file.truncate(0)
+			for id_, metadata in id_to_metadata_map.items():
+				self._metadata_file.write(self._serialize_metadata_record(id_, metadata))
+			self._metadata_file.flush()
+
+	def _save_metadata(self, id_: int, metadata: RawPageMetadata):
+		self._pending_metadata_ids.append(id_)
+		self._get_id_to_metadata_map()[id_] = metadata
+
+	def _commit_unless_in_batch(self):
+		if len(self._batch_durabilities) == 0:
+			self._commit(self._durability)
+
+	def _commit(self, durability: str):
+		# Page markup is written first and the index last,
+		# so after a crash the index never points to a page that was not written
+		if len(self._pending_markups) > 0:
+			self._page_storage.write_many(list(self._pending_markups.items()), durability == "fsync")
+			self._pending_markups = {}
+
+		if len(self._pending_metadata_ids) > 0:
+			id_to_metadata_map = self._get_id_to_metadata_map()
+			for id_ in self._pending_metadata_ids:
+				self._metadata_file.write(self._serialize_metadata_record(id_, id_to_metadata_map[id_]))
+			self._pending_metadata_ids = []
+			self._sync_file(self._metadata_file, durability)
+
+		if len(self._pending_index_ids) > 0:
+			for id_ in self._pending_index_ids:
+				self._append_index_line_to_file(id_, self._id_to_url_map[id_])
+			self._pending_index_ids = []
+			self._sync_file(self._index_file, durability)
+			self._is_manifest_stale = True
+
+	def _open_file(self, full_file_name: Path) -> TextIO:
+		if not self._read_only:
+			return open(full_file_name, "a+", encoding = self._file_encoding)
+		if not full_file_name.is_file():
+			# A repository that was never written reads as empty
+			return io.StringIO()
+		return open(full_file_name, "r", encoding = self._file_encoding)
+
+	def _ensure_writable(self):
+		if self._read_only:
+			raise io.UnsupportedOperation("The page repository is opened read-only")
+
+	def _get_current_durability(self) -> str:
+		return self._batch_durabilities[0] if len(self._batch_durabilities) > 0 else self._durability
+
+	def _get_markup(self, id_: int) -> str:
+		markup = self._pending_markups.get(id_)
+		return markup if markup is not None else self._page_storage.read(id_)
 
 	def _recreate_index_file(self):
 		self._index_file.truncate(0)
@@ -90,8 +425,14 @@ class RawPageRepository:
 		index_line = self._serialize_index_record(id_, url)
 		self._index_file.write(index_line)
 
-	def _get_page_full_file_name(self, id_: int):
-		return self._pages_path.joinpath(f"{id_}.txt")
+	@staticmethod
+	def _sync_file(file: TextIO, durability: str):
+		if durability == "none":
+			return
+
+		file.flush()
+		if durability == "fsync":
+			os.fsync(file.fileno())
 
 	@staticmethod
 	def _serialize_index_record(id_: int, url: str) -> str:
@@ -99,5 +440,26 @@ class RawPageRepository:
 
 	@staticmethod
 	def _deserialize_index_record(index_line: str) -> IndexRecord:
-		record_values = index_line.rstrip("\n").split(" ")
+		record_values = index_line.rstrip("\r\n").split(" ")
 		return RawPageRepository.IndexRecord(int(record_values[0]), record_values[1])
+
+	@staticmethod
+	def _serialize_metadata_record(id_: int, metadata: RawPageMetadata) -> str:
+		return json.dumps({
+			"id": id_,
+			"etag": metadata.etag,
+			"last_modified": metadata.last_modified,
+			"content_hash": metadata.content_hash,
+			"simhash": metadata.simhash
+		}, ensure_ascii = False) + "\n"
+
+	@staticmethod
+	def _deserialize_metadata_record(metadata_line: str) -> Tuple[int, RawPageMetadata]:
+		record_values = json.loads(metadata_line)
+		return (
+			int(record_values["id"]),
+			RawPageMetadata(
+				record_values["etag"],
+				record_values["last_modified"],
+				record_values["content_hash"],
+				record_values.get("simhash")))
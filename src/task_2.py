@@ -1,39 +1,37 @@
-from bs4 import BeautifulSoup
+from typing import Optional
+
 import nltk
-import string
-import re
 import pymorphy3
-from os import listdir
 from nltk.corpus import stopwords
-from nltk.tokenize import wordpunct_tokenize
-
-
-nltk.download('stopwords')
+from indexing import iter_page_token_counts
+from normalization import TokenNormalizer
+from raw_pages import RawPageRepository
 
 
 class ProcessingContext:
-    def __init__(self):
-        self.pages_dir_path = 'raw-pages/pages/'
+    def __init__(self, indexing_workers: Optional[int] = None):
+        self.page_repository = RawPageRepository(read_only = True)
         self.tokens = set()
         self.lemmas = dict()
+        nltk.download('stopwords')
         self.stop_words = set(stopwords.words('russian'))
         self.morph_analyzer = pymorphy3.MorphAnalyzer()
+        self.token_normalizer = TokenNormalizer(self.morph_analyzer, self.stop_words)
+        self.indexing_workers = indexing_workers
 
 
 def get_tokens(processing_context):
-    for file_name in listdir(processing_context.pages_dir_path):
-        with open(processing_context.pages_dir_path + '/' + file_name, 'r', encoding='utf-8') as page_content:
-            text = BeautifulSoup(page_content, features='html.parser').get_text()
-            tokens = wordpunct_tokenize(text)
-            processing_context.tokens = processing_context.tokens | set(filter(
-                lambda token: is_correct(processing_context, token), tokens))
+    for _, token_counts in iter_page_token_counts(
+            processing_context.page_repository,
+            processing_context.token_normalizer,
+            processing_context.indexing_workers):
+        processing_context.tokens.update(token_counts)
     write_tokens(processing_context)
 
 
 def group_tokens_by_lemmas(processing_context):
     for token in processing_context.tokens:
-        parsed_token = processing_context.morph_analyzer.parse(token)[0]
-        normal_form = parsed_token.normal_form if parsed_token.normalized.is_known else token.lower()
+        normal_form = processing_context.token_normalizer.get_lemma(token)
         if normal_form not in processing_context.lemmas:
             processing_context.lemmas[normal_form] = []
         processing_context.lemmas[normal_form].append(token)
@@ -57,16 +55,7 @@ def write_tokens(processing_context):
 
 
 def is_correct(processing_context, token):
-    are_stuck_words = False
-    if sum(map(str.isupper, token[1:])) > 0 and (sum(map(str.islower, token[1:])) > 0 or str.islower(token[0])):
-        are_stuck_words = True
-    is_good_word = True if processing_context.morph_analyzer.parse(token)[0].score >= 0.5 else False
-    has_punctuation = True if any(x in string.punctuation for x in token) else False
-    is_stop_word = bool(token.lower() in processing_context.stop_words)
-    is_number = bool(re.compile(r'^[0-9]+$').match(token))
-    is_russian = bool(re.compile(r'^[а-яА-Я]{2,}$').match(token))
-    return not has_punctuation and not is_stop_word and not is_number and is_russian and not are_stuck_words and \
-        is_good_word
+    return processing_context.token_normalizer.is_valid(token)
 
 
 def main():
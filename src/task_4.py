@@ -1,68 +1,64 @@
+import argparse
 import math
-import re
-import string
+import os
 from pathlib import Path
+from typing import Any, Dict, List, Optional
 
 import nltk
 import pymorphy3
-from bs4 import BeautifulSoup
 from nltk.corpus import stopwords
-from nltk.tokenize import wordpunct_tokenize
+from indexing import count_tokens, iter_page_token_counts
+from normalization import TokenNormalizer
+from raw_pages import RawPageRepository
+from tf_idf_index import TfIdfIndex
+from tf_idf_matrix import TfIdfMatrix, write_tf_idf_matrix
 
-nltk.download('stopwords')
+tf_idf_index_file_name = 'tf_idf_index.json'
+token_tf_idf_matrix_file_name = 'token_tf_idf.bin'
+lemma_tf_idf_matrix_file_name = 'lemma_tf_idf.bin'
 
 
 class ProcessingContext:
-    def __init__(self):
-        self.pages_dir_path = 'raw-pages/pages/'
+    def __init__(self, indexing_workers: Optional[int] = None):
+        self.page_repository = RawPageRepository(read_only = True)
         self.pages_lemmas_dir_path = 'each-pages-lemmas/'
+        nltk.download('stopwords')
         self.stop_words = set(stopwords.words('russian'))
         self.morph_analyzer = pymorphy3.MorphAnalyzer()
+        self.token_normalizer = TokenNormalizer(self.morph_analyzer, self.stop_words)
+        self.indexing_workers = indexing_workers
 
 
-def get_tokens(processing_context, file_name):
-    filtered_tokens = list
-    tokens_counts = {}
-    with open(processing_context.pages_dir_path + '/' + file_name, 'r', encoding='utf-8') as page_content:
-        text = BeautifulSoup(page_content, features='html.parser').get_text()
-        tokens = wordpunct_tokenize(text)
-        filtered_tokens = list(filter(
-            lambda tk: is_correct(processing_context, tk), tokens))
-        for token in filtered_tokens:
-            if token in tokens_counts:
-                tokens_counts[token] = tokens_counts[token] + 1
-            else:
-                tokens_counts[token] = 1
-
-    return tokens_counts
+def get_tokens(processing_context, page_markup):
+    return count_tokens(processing_context.token_normalizer, page_markup)
 
 
 def is_correct(processing_context, token):
-    are_stuck_words = False
-    if sum(map(str.isupper, token[1:])) > 0 and (sum(map(str.islower, token[1:])) > 0 or str.islower(token[0])):
-        are_stuck_words = True
-    is_good_word = True if processing_context.morph_analyzer.parse(token)[0].score >= 0.5 else False
-    has_punctuation = True if any(x in string.punctuation for x in token) else False
-    is_stop_word = bool(token.lower() in processing_context.stop_words)
-    is_number = bool(re.compile(r'^[0-9]+$').match(token))
-    is_russian = bool(re.compile(r'^[а-яА-Я]{2,}$').match(token))
-    return not has_punctuation and not is_stop_word and not is_number and is_russian and not are_stuck_words and \
-        is_good_word
+    return processing_context.token_normalizer.is_valid(token)
 
 
 def get_pages_tokens(processing_context: ProcessingContext):
-    index = open('raw-pages/index.txt', 'r')
-    line = index.readline()
     pages_tokens = []
-    while line:
-        parsed_index_line = line.rstrip("\r\n").split(' ', 1)
-        file_name = parsed_index_line[0] + '.txt'
-        pages_tokens.append(get_tokens(processing_context, file_name))
-        line = index.readline()
+    for _, token_counts in iter_page_token_counts(
+            processing_context.page_repository,
+            processing_context.token_normalizer,
+            processing_context.indexing_workers):
+        pages_tokens.append(token_counts)
 
     return pages_tokens
 
 
+def load_tf_idf_index(processing_context: ProcessingContext):
+    # Only pages added, changed or deleted since the last run are read and tokenized again
+    tf_idf_index = TfIdfIndex(tf_idf_index_file_name)
+    tf_idf_index.synchronize(
+        processing_context.page_repository,
+        processing_context.token_normalizer,
+        processing_context.indexing_workers)
+    tf_idf_index.save()
+    return tf_idf_index
+
+
 def calculate_token_tf(pages_tokens: list):
     pages_tf = []
     for page in pages_tokens:
@@ -76,55 +72,52 @@ def calculate_token_tf(pages_tokens: list):
     return pages_tf
 
 
-def calculate_token_idf(pages_tokens: list):
-    idf = {}
-    pages_count = len(pages_tokens)
-    for page in pages_tokens:
-        for token in page:
-            if token not in idf:
-                idf[token] = math.log(pages_count / (find_token_entrance_count_among_pages(pages_tokens, token) + 1))
+def calculate_token_idf(pages_tokens: List[Dict[str, int]]) -> Dict[str, float]:
+    return calculate_idf(count_document_frequencies(pages_tokens), len(pages_tokens))
 
-    return idf
 
+def count_document_frequencies(pages_terms: List[Dict[str, Any]]) -> Dict[str, int]:
+    document_frequencies: Dict[str, int] = {}
+    for page in pages_terms:
+        for term in page:
+            document_frequencies[term] = document_frequencies.get(term, 0) + 1
 
-def find_token_entrance_count_among_pages(pages_tokens, token):
-    counter = 0
-    for page in pages_tokens:
-        if token in page:
-            counter = counter + 1
+    return document_frequencies
 
-    return counter
+
+def calculate_idf(document_frequencies: Dict[str, int], pages_count: int) -> Dict[str, float]:
+    idf: Dict[str, float] = {}
+    for term, document_frequency in document_frequencies.items():
+        idf[term] = math.log(pages_count / (document_frequency + 1))
+
+    return idf
 
 
 def calculate_lemma_tf(processing_context: ProcessingContext, pages_tokens: list):
     pages_tf = []
     for page in pages_tokens:
-        page_tf = {}
-        for token in page:
-            parsed_token = processing_context.morph_analyzer.parse(token)[0]
-            normal_form = parsed_token.normal_form if parsed_token.normalized.is_known else token.lower()
-            if normal_form not in page_tf:
-                page_tf[normal_form] = page.get(token)
-            else:
-                page_tf[normal_form] += page.get(token)
+        pages_tf.append(calculate_page_lemma_tf(processing_context, page))
+
+    return pages_tf
 
-        for lemma in page_tf:
-            page_tf[lemma] = page_tf[lemma] / len(page)
 
-        pages_tf.append(page_tf)
+def calculate_page_lemma_tf(processing_context: ProcessingContext, page: dict):
+    page_tf = {}
+    for token in page:
+        normal_form = processing_context.token_normalizer.get_lemma(token)
+        if normal_form not in page_tf:
+            page_tf[normal_form] = page.get(token)
+        else:
+            page_tf[normal_form] += page.get(token)
 
-    return pages_tf
+    for lemma in page_tf:
+        page_tf[lemma] = page_tf[lemma] / len(page)
 
+    return page_tf
 
-def calculate_lemmas_idf(lemma_tf: list):
-    idf = {}
-    pages_count = len(lemma_tf)
-    for page in lemma_tf:
-        for lemma in page:
-            if lemma not in idf:
-                idf[lemma] = math.log(pages_count / (find_token_entrance_count_among_pages(lemma_tf, lemma) + 1))
 
-    return idf
+def calculate_lemmas_idf(lemma_tf: list):
+    return calculate_idf(count_document_frequencies(lemma_tf), len(lemma_tf))
 
 
 def write_tf_idf(tf: list, idf: dict, directory_name: str):
@@ -140,15 +133,44 @@ def write_tf_idf(tf: list, idf: dict, directory_name: str):
                 file.write(line)
 
 
+def write_tf_idf_matrices(tf_idf_index: TfIdfIndex, write_text: bool = False):
+    page_ids = tf_idf_index.get_page_ids()
+    token_tf = calculate_token_tf([tf_idf_index.get_token_counts(page_id) for page_id in page_ids])
+    lemma_tf = [tf_idf_index.get_lemma_tf(page_id) for page_id in page_ids]
+    write_tf_idf_matrix(token_tf_idf_matrix_file_name, page_ids, token_tf, tf_idf_index.get_token_idf())
+    write_tf_idf_matrix(lemma_tf_idf_matrix_file_name, page_ids, lemma_tf, tf_idf_index.get_lemma_idf())
+    if write_text:
+        write_tf_idf(token_tf, tf_idf_index.get_token_idf(), 'token_tf_idf')
+        write_tf_idf(lemma_tf, tf_idf_index.get_lemma_idf(), 'lemma_tf_idf')
+
+
+def is_tf_idf_matrix_stale(processing_context: ProcessingContext) -> bool:
+    if not os.path.isfile(token_tf_idf_matrix_file_name) or not os.path.isfile(lemma_tf_idf_matrix_file_name):
+        return True
+    last_modified_time = processing_context.page_repository.get_last_modified_time()
+    return os.path.getmtime(token_tf_idf_matrix_file_name) < last_modified_time \
+        or os.path.getmtime(lemma_tf_idf_matrix_file_name) < last_modified_time
+
+
+def load_lemma_tf_idf_matrix(processing_context: ProcessingContext):
+    # The pages are only tokenized when they changed after the matrices were written
+    if not is_tf_idf_matrix_stale(processing_context):
+        try:
+            return TfIdfMatrix(lemma_tf_idf_matrix_file_name)
+        except ValueError:
+            # Written in an older format
+            pass
+    write_tf_idf_matrices(load_tf_idf_index(processing_context))
+    return TfIdfMatrix(lemma_tf_idf_matrix_file_name)
+
+
 def main():
+    parser = argparse.ArgumentParser(description='Calculates TF-IDF of the page tokens and lemmas')
+    parser.add_argument('--text', action='store_true', help='also write a text file of TF-IDF per page')
+    arguments = parser.parse_args()
+
     processing_context = ProcessingContext()
-    pages_tokens = get_pages_tokens(processing_context)
-    token_tf = calculate_token_tf(pages_tokens)
-    token_idf = calculate_token_idf(pages_tokens)
-    lemma_tf = calculate_lemma_tf(processing_context, pages_tokens)
-    lemma_idf = calculate_lemmas_idf(lemma_tf)
-    write_tf_idf(token_tf, token_idf, 'token_tf_idf')
-    write_tf_idf(lemma_tf, lemma_idf, 'lemma_tf_idf')
+    write_tf_idf_matrices(load_tf_idf_index(processing_context), arguments.text)
 
 
 if __name__ == '__main__':
@@ -1,57 +1,50 @@
-from copy import copy
-
 import nltk
 import pymorphy3
-from typing import Dict, List
+from typing import Dict, List, Mapping, Optional, Tuple, Union
 
-from task_4 import is_correct
 from bs4 import BeautifulSoup
 from nltk.corpus import stopwords
 from nltk.tokenize import wordpunct_tokenize
 from collections import Counter
-from nltk.corpus import stopwords
-from src.task_4 import ProcessingContext, get_pages_tokens, calculate_lemma_tf, calculate_lemmas_idf
+from task_4 import ProcessingContext, is_correct, load_lemma_tf_idf_matrix
+from cosine_search import CosineSearchEngine
+from normalization import TokenNormalizer
+from raw_pages import RawPageRepository
+from tf_idf_matrix import TfIdfMatrix
 
 
-class VectorSearch:
+class QueryContext:
+    # Queries are only normalized, so unlike ProcessingContext it opens no page repository
     def __init__(self):
-        self.__distance_threshold: float = 1
-        self.pages_dir_path = 'raw-pages/pages/'
-        self.pages_lemmas_dir_path = 'each-pages-lemmas/'
+        nltk.download('stopwords')
         self.stop_words = set(stopwords.words('russian'))
-        self.morph_analyzer = pymorphy3.MorphAnalyzer()
+        self.token_normalizer = TokenNormalizer(pymorphy3.MorphAnalyzer(), self.stop_words)
 
-    def scalar_product(self, vector1: List[float], vector2: List[float]) -> float:
-        return sum(map(lambda first, second: first * second, vector1, vector2))
 
-    def calculate_distance(self, first_vector: list, second_vector: list):
-        return 1 - self.scalar_product(first_vector, second_vector) / (len(first_vector) * len(second_vector))
+class VectorSearch:
+    def __init__(self, tf_idf_matrix: Optional[TfIdfMatrix] = None):
+        self.__distance_threshold: float = 1
+        self.pages_lemmas_dir_path = 'each-pages-lemmas/'
+        self.search_engine = None if tf_idf_matrix is None else CosineSearchEngine(tf_idf_matrix)
 
     def calculate_pages_tf_idf(self):
         processing_context = ProcessingContext()
-        pages_tokens = get_pages_tokens(processing_context)
-        lemma_tf = calculate_lemma_tf(processing_context, pages_tokens)
-        lemma_idf = calculate_lemmas_idf(lemma_tf)
-        pages_tf_idf: List[Dict[str, float]] = list()
-        for page_number in range(0, len(lemma_tf)):
-            lemma_tf_idf = {}
-            for term in lemma_tf[page_number]:
-                term_tf_idf = lemma_tf[page_number][term] * lemma_idf[term]
-                lemma_tf_idf[term] = term_tf_idf
+        with load_lemma_tf_idf_matrix(processing_context) as tf_idf_matrix:
+            pages_tf_idf: List[Dict[str, float]] = list()
+            for row in range(len(tf_idf_matrix)):
+                pages_tf_idf.append(tf_idf_matrix.get_page_weights(row))
 
-            pages_tf_idf.append(lemma_tf_idf)
-
-        return pages_tf_idf, lemma_idf
+            return pages_tf_idf, tf_idf_matrix.get_idf()
 
     def calculate_query_tf_idf(self, query_lemmas_tf, pages_idf):
-        query_tf_idf: Dict[str, float] = {x: 0 for x in copy(pages_idf)}
+        query_tf_idf: Dict[str, float] = {}
         for lemma in query_lemmas_tf:
             if lemma in pages_idf:
                 query_tf_idf[lemma] = query_lemmas_tf[lemma] * pages_idf[lemma]
 
         return query_tf_idf
 
-    def calculate_query_tf(self, pc: ProcessingContext, query):
+    def calculate_query_tf(self, pc: Union[ProcessingContext, QueryContext], query):
         text = BeautifulSoup(query, features='html.parser').get_text()
         tokens = wordpunct_tokenize(text)
 
@@ -60,49 +53,36 @@ class VectorSearch:
 
         return query_lemmas_tf
 
-
-    def complement_page_vector(self, pages_lemmas_tf_idf, query_lemmas_tf_idf):
-        complemented_page_vector = copy(pages_lemmas_tf_idf)
-        for page in pages_lemmas_tf_idf:
-            for lemma in query_lemmas_tf_idf:
-                if lemma not in page:
-                    page[lemma] = 0
-
-        return complemented_page_vector
-
-
-    def search(self, pages_lemmas_tf_idf: List[dict], query_lemmas_tf_idf: dict):
+    def search(self, query_lemmas_tf: Mapping[str, int]) -> List[Tuple[int, float]]:
+        assert self.search_engine is not None
         result_documents = list()
 
-        query_vector_tf_idf = list(
-            map(
-                lambda x: x[1],
-                sorted(query_lemmas_tf_idf.items(), key = lambda x: x[0])))
-        for page_id in range(len(pages_lemmas_tf_idf)):
-            page_vector_tf_idf = list(
-                map(
-                    lambda x: x[1],
-                    sorted(pages_lemmas_tf_idf[page_id].items(), key = lambda x: x[0])))
-            distance_to_page = self.calculate_distance(page_vector_tf_idf, query_vector_tf_idf)
+        # Cosine distance, only the pages that share a lemma with the query are scored
+        page_ids, similarities = self.search_engine.score(self.search_engine.get_query_weights(query_lemmas_tf))
+        for page_id, similarity in zip(page_ids.tolist(), similarities.tolist()):
+            distance_to_page = 1 - similarity
             if distance_to_page < self.__distance_threshold:
                 result_documents.append((page_id, distance_to_page))
 
         return result_documents
 
+    def search_top_k(self, query_lemmas_tf: Mapping[str, int], k: int) -> List[Tuple[int, float]]:
+        assert self.search_engine is not None
+        top_pages = self.search_engine.search_top_k(self.search_engine.get_query_weights(query_lemmas_tf), k)
+        return [(page_id, 1 - similarity) for page_id, similarity in top_pages]
+
 
 def get_normalized_form(processing_context, token):
-    parsed_token = processing_context.morph_analyzer.parse(token)[0]
-    return parsed_token.normal_form if parsed_token.normalized.is_known else token.lower()
+    return processing_context.token_normalizer.get_lemma(token)
 
 
 def get_index():
-    index: Dict[int, str] = {}
-    with open('raw-pages/index.txt', 'r', encoding='utf-8') as index_file:
-        line = index_file.readline()
-        while line:
-            index[int(line.split(' ')[0])] = line.split(' ')[1].split('\n')[0]
-            line = index_file.readline()
-
+    # Only the URLs are needed, so the repository is not kept open for the life of the caller
+    page_repository = RawPageRepository(read_only = True)
+    try:
+        index: Dict[int, str] = page_repository.get_index()
+    finally:
+        page_repository.close()
     return index
 
 
@@ -112,24 +92,20 @@ def main():
     index = get_index()
 
     print("Загружаю рассчитанные значения TF–IDF \n")
-    lemmas_tf_idf, lemmas_idf = VectorSearch().calculate_pages_tf_idf()
+    tf_idf_matrix = load_lemma_tf_idf_matrix(pc)
 
     print("Произвожу предрасчёты для векторного поиска \n")
-    search: VectorSearch = VectorSearch()
+    search: VectorSearch = VectorSearch(tf_idf_matrix)
 
     while True:
         query: str = input("Введите поисковый запрос: ")
 
-        query_lemmas_tf_idf = VectorSearch().calculate_query_tf_idf(VectorSearch().calculate_query_tf(pc, query),
-                                                                    lemmas_idf)
-
-        complemented_pages_vector = VectorSearch().complement_page_vector(lemmas_tf_idf, query_lemmas_tf_idf)
-        result_documents = search.search(complemented_pages_vector, query_lemmas_tf_idf)
+        result_documents = search.search(search.calculate_query_tf(pc, query))
 
         print('\n\nРезультаты: \n')
         if len(result_documents) > 0:
             for document_id, _ in result_documents:
-                url = index[str(document_id)]
+                url = index[document_id]
                 print('ID страницы: ' + str(document_id) + ' | URL: ' + url)
         else:
             print("Ничего не найдено")
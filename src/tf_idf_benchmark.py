@@ -0,0 +1,72 @@
+import argparse
+import math
+import random
+import time
+from typing import Callable, Dict, List, Tuple
+
+from task_4 import calculate_token_idf
+
+
+def generate_pages_tokens(
+        pages_count: int,
+        vocabulary_size: int,
+        words_per_page: int,
+        seed: int = 0
+    ) -> List[Dict[str, int]]:
+    generator = random.Random(seed)
+    vocabulary = ['слово' + str(i) for i in range(vocabulary_size)]
+    # Zipf-like weights, the same shape as word frequencies of a real corpus
+    weights = [1 / (rank + 1) for rank in range(vocabulary_size)]
+
+    pages_tokens: List[Dict[str, int]] = []
+    for _ in range(pages_count):
+        page: Dict[str, int] = {}
+        for token in generator.choices(vocabulary, weights, k=words_per_page):
+            page[token] = page.get(token, 0) + 1
+        pages_tokens.append(page)
+
+    return pages_tokens
+
+
+def calculate_token_idf_by_page_scans(pages_tokens: List[Dict[str, int]]) -> Dict[str, float]:
+    # The previous implementation: every distinct term scans all pages for its document frequency
+    idf: Dict[str, float] = {}
+    pages_count = len(pages_tokens)
+    for page in pages_tokens:
+        for token in page:
+            if token not in idf:
+                entrance_count = sum(1 for other_page in pages_tokens if token in other_page)
+                idf[token] = math.log(pages_count / (entrance_count + 1))
+
+    return idf
+
+
+def measure(
+        function: Callable[[List[Dict[str, int]]], Dict[str, float]],
+        pages_tokens: List[Dict[str, int]]
+    ) -> Tuple[Dict[str, float], float]:
+    start_time = time.perf_counter()
+    result = function(pages_tokens)
+    return result, time.perf_counter() - start_time
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Compares IDF calculation by page scans with the single-pass one')
+    parser.add_argument('--pages', type=int, nargs='+', default=[250, 500, 1000, 2000])
+    parser.add_argument('--vocabulary-size', type=int, default=20000)
+    parser.add_argument('--words-per-page', type=int, default=300)
+    arguments = parser.parse_args()
+
+    print('pages  terms  page scans, s  single pass, s')
+    for pages_count in arguments.pages:
+        pages_tokens = generate_pages_tokens(pages_count, arguments.vocabulary_size, arguments.words_per_page)
+        scanned_idf, scan_time = measure(calculate_token_idf_by_page_scans, pages_tokens)
+        single_pass_idf, single_pass_time = measure(calculate_token_idf, pages_tokens)
+        if list(scanned_idf.items()) != list(single_pass_idf.items()):
+            raise AssertionError('IDF values differ for ' + str(pages_count) + ' pages')
+
+        print(f'{pages_count:5}  {len(single_pass_idf):5}  {scan_time:13.3f}  {single_pass_time:14.4f}')
+
+
+if __name__ == '__main__':
+    main()
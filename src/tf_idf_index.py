@@ -0,0 +1,204 @@
+import json
+import math
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Set
+
+from file_io import atomic_write
+from indexing import iter_page_term_counts
+from normalization import TokenNormalizer
+from raw_pages import RawPageRepository
+
+tf_idf_index_format_version = 1
+
+
+class DocumentTerms:
+	def __init__(
+			self,
+			content_hash: str,
+			token_counts: Dict[str, int],
+			lemma_counts: Dict[str, int],
+			page_stamp: Optional[str] = None):
+		self.content_hash = content_hash
+		self.token_counts = token_counts
+		self.lemma_counts = lemma_counts
+		self.page_stamp = page_stamp
+
+
+class PageChanges:
+	def __init__(
+			self,
+			added_page_ids: Optional[Iterable[int]] = None,
+			changed_page_ids: Optional[Iterable[int]] = None,
+			deleted_page_ids: Optional[Iterable[int]] = None):
+		self.added_page_ids: Set[int] = set(added_page_ids or ())
+		self.changed_page_ids: Set[int] = set(changed_page_ids or ())
+		self.deleted_page_ids: Set[int] = set(deleted_page_ids or ())
+
+	def __len__(self) -> int:
+		return len(self.added_page_ids) + len(self.changed_page_ids) + len(self.deleted_page_ids)
+
+
+class TfIdfIndex:
+	def __init__(self, file_name: str, file_encoding: str = "utf-8"):
+		self._file_name = file_name
+		self._file_encoding = file_encoding
+		self._documents: Dict[int, DocumentTerms] = {}
+		self._token_document_frequencies: Dict[str, int] = {}
+		self._lemma_document_frequencies: Dict[str, int] = {}
+		self._token_idf: Optional[Dict[str, float]] = None
+		self._lemma_idf: Optional[Dict[str, float]] = None
+		self._is_saved = True
+
+		self._load()
+
+	def __len__(self) -> int:
+		return len(self._documents)
+
+	def __contains__(self, page_id: int) -> bool:
+		return page_id in self._documents
+
+	def get_page_ids(self) -> List[int]:
+		return sorted(self._documents)
+
+	def get_token_counts(self, page_id: int) -> Dict[str, int]:
+		return self._documents[page_id].token_counts
+
+	def get_lemma_counts(self, page_id: int) -> Dict[str, int]:
+		return self._documents[page_id].lemma_counts
+
+	def get_token_idf(self) -> Dict[str, float]:
+		if self._token_idf is None:
+			self._token_idf = self._calculate_idf(self._token_document_frequencies)
+		return self._token_idf
+
+	def get_lemma_idf(self) -> Dict[str, float]:
+		if self._lemma_idf is None:
+			self._lemma_idf = self._calculate_idf(self._lemma_document_frequencies)
+		return self._lemma_idf
+
+	def get_lemma_tf(self, page_id: int) -> Dict[str, float]:
+		document = self._documents[page_id]
+		# Lemma TF is divided by the number of distinct tokens of the page, the same as task_4 has always done
+		token_count = len(document.token_counts)
+		return {lemma: count / token_count for lemma, count in document.lemma_counts.items()}
+
+	def find_changes(self, page_repository: RawPageRepository) -> PageChanges:
+		repository_page_ids = page_repository.get_index().keys()
+		changes = PageChanges(
+			repository_page_ids - self._documents.keys(),
+			deleted_page_ids = self._documents.keys() - repository_page_ids)
+		for page_id, document in self._documents.items():
+			metadata = page_repository.get_metadata(page_id, calculate_missing = False)
+			if metadata is not None:
+				is_changed = metadata.content_hash != document.content_hash
+			else:
+				# Hashing the pages of a repository without metadata would read every page on every run
+				is_changed = page_repository.get_page_stamp(page_id) != document.page_stamp
+			if is_changed:
+				changes.changed_page_ids.add(page_id)
+		return changes
+
+	def update(
+			self,
+			page_repository: RawPageRepository,
+			token_normalizer: TokenNormalizer,
+			changes: PageChanges,
+			workers: Optional[int] = None) -> None:
+		if len(changes) == 0:
+			return
+
+		for page_id in changes.changed_page_ids | changes.deleted_page_ids:
+			self._remove_document(page_id)
+
+		# Pages that are gone from the repository are skipped by the reader and stay removed
+		page_ids = sorted(changes.added_page_ids | changes.changed_page_ids)
+		for page_id, (token_counts, lemma_counts) in iter_page_term_counts(
+				page_repository, token_normalizer, workers, page_ids = page_ids):
+			metadata = page_repository.get_metadata(page_id)
+			assert metadata is not None
+			self._add_document(
+				page_id,
+				DocumentTerms(metadata.content_hash, token_counts, lemma_counts, page_repository.get_page_stamp(page_id)))
+
+		# A new page count changes the IDF of every term, so it is recalculated on demand
+		self._token_idf = None
+		self._lemma_idf = None
+		self._is_saved = False
+
+	def synchronize(
+			self,
+			page_repository: RawPageRepository,
+			token_normalizer: TokenNormalizer,
+			workers: Optional[int] = None) -> PageChanges:
+		changes = self.find_changes(page_repository)
+		self.update(page_repository, token_normalizer, changes, workers)
+		return changes
+
+	def save(self) -> None:
+		if self._is_saved:
+			return
+
+		serialized_index = {
+			"version": tf_idf_index_format_version,
+			"pages": {
+				str(page_id): {
+					"content_hash": document.content_hash,
+					"token_counts": document.token_counts,
+					"lemma_counts": document.lemma_counts,
+					"page_stamp": document.page_stamp}
+				for page_id, document in self._documents.items()}
+		}
+
+		with atomic_write(self._file_name, "w", self._file_encoding) as file:
+			json.dump(serialized_index, file, ensure_ascii = False)
+		self._is_saved = True
+
+	def _load(self):
+		if not Path(self._file_name).is_file():
+			return
+
+		with open(self._file_name, "r", encoding = self._file_encoding) as file:
+			serialized_index = json.load(file)
+		if serialized_index.get("version") != tf_idf_index_format_version:
+			# An index of another format is built again from the pages
+			self._is_saved = False
+			return
+
+		for page_id, serialized_document in serialized_index["pages"].items():
+			self._add_document(
+				int(page_id),
+				DocumentTerms(
+					serialized_document["content_hash"],
+					serialized_document["token_counts"],
+					serialized_document["lemma_counts"],
+					serialized_document.get("page_stamp")))
+
+	def _add_document(self, page_id: int, document: DocumentTerms):
+		self._documents[page_id] = document
+		for token in document.token_counts:
+			self._token_document_frequencies[token] = self._token_document_frequencies.get(token, 0) + 1
+		for lemma in document.lemma_counts:
+			self._lemma_document_frequencies[lemma] = self._lemma_document_frequencies.get(lemma, 0) + 1
+
+	def _remove_document(self, page_id: int):
+		document = self._documents.pop(page_id, None)
+		if document is None:
+			return
+
+		_decrement_document_frequencies(self._token_document_frequencies, document.token_counts)
+		_decrement_document_frequencies(self._lemma_document_frequencies, document.lemma_counts)
+
+	def _calculate_idf(self, document_frequencies: Dict[str, int]) -> Dict[str, float]:
+		page_count = len(self._documents)
+		return {
+			term: math.log(page_count / (document_frequency + 1))
+			for term, document_frequency in document_frequencies.items()}
+
+
+def _decrement_document_frequencies(document_frequencies: Dict[str, int], terms: Iterable[str]):
+	for term in terms:
+		document_frequency = document_frequencies[term] - 1
+		if document_frequency == 0:
+			del document_frequencies[term]
+		else:
+			document_frequencies[term] = document_frequency
@@ -0,0 +1,180 @@
+import math
+from pathlib import Path
+import struct
+from typing import Any, Dict, List, Mapping, Optional, Sequence, Tuple, Union
+
+import numpy
+from numpy.typing import NDArray
+
+from file_io import MappedFile, write_aligned_sections
+
+tf_idf_matrix_format_version = 3
+
+# Header: magic, format version, page count, term count, nonzero weight count, term bytes size
+_header = struct.Struct("<4sIIIQQ")
+_tf_idf_matrix_magic = b"TFIM"
+
+_page_id_type = numpy.dtype("<u4")
+_offset_type = numpy.dtype("<u8")
+_term_id_type = numpy.dtype("<u4")
+_weight_type = numpy.dtype("<f4")
+_bound_type = numpy.dtype("<f8")
+
+
+def write_tf_idf_matrix(
+		file_name: Union[str, Path],
+		page_ids: Sequence[int],
+		pages_tf: Sequence[Mapping[str, float]],
+		idf: Mapping[str, float]) -> None:
+	# Terms are sorted, so term ids follow the vocabulary order and every row keeps its term ids ascending.
+	# UTF-8 keeps the code point order, so the encoded terms are sorted as well
+	terms = sorted(idf)
+	term_ids = {term: term_id for term_id, term in enumerate(terms)}
+
+	row_offsets = [0]
+	row_term_ids: List[int] = []
+	row_weights: List[float] = []
+	norms: List[float] = []
+	for page_tf in pages_tf:
+		row = sorted((term_ids[term], tf * idf[term]) for term, tf in page_tf.items())
+		row_term_ids.extend(term_id for term_id, _ in row)
+		row_weights.extend(weight for _, weight in row)
+		# Norms are calculated from the exact weights before they are stored as float32
+		norms.append(math.sqrt(math.fsum(weight * weight for _, weight in row)))
+		row_offsets.append(len(row_term_ids))
+
+	encoded_terms = [term.encode("utf-8") for term in terms]
+	term_offsets = [0]
+	for encoded_term in encoded_terms:
+		term_offsets.append(term_offsets[-1] + len(encoded_term))
+	term_bytes = b"".join(encoded_terms)
+
+	# The same weights are also stored by term (CSC), so a query reads only the pages of its own terms
+	row_term_id_array = numpy.array(row_term_ids, _term_id_type)
+	column_order = numpy.argsort(row_term_id_array, kind = "stable")
+	column_offsets = numpy.concatenate(([0], numpy.cumsum(numpy.bincount(row_term_id_array, minlength = len(terms)))))
+	row_numbers = numpy.repeat(numpy.arange(len(pages_tf), dtype = _page_id_type), numpy.diff(row_offsets))
+	column_rows = row_numbers[column_order]
+	column_weights = numpy.array(row_weights, _weight_type)[column_order]
+
+	# The largest weight of a term divided by its page norm bounds what the term can add to a cosine similarity.
+	# It is calculated from the stored float32 values, so no similarity calculated from them can exceed it
+	stored_norms = numpy.array(norms, _weight_type).astype(numpy.float64)
+	normalized_weights = normalize_weights(column_weights, stored_norms[column_rows])
+	term_max_normalized_weights = numpy.zeros(len(terms), _bound_type)
+	non_empty_columns = numpy.flatnonzero(numpy.diff(column_offsets) > 0)
+	if len(non_empty_columns) > 0:
+		term_max_normalized_weights[non_empty_columns] = numpy.maximum.reduceat(
+			numpy.abs(normalized_weights),
+			column_offsets[non_empty_columns])
+
+	sections = [
+		numpy.array(page_ids, _page_id_type).tobytes(),
+		numpy.array(row_offsets, _offset_type).tobytes(),
+		numpy.array(norms, _weight_type).tobytes(),
+		numpy.array([idf[term] for term in terms], _weight_type).tobytes(),
+		numpy.array(term_offsets, _offset_type).tobytes(),
+		numpy.array(row_term_ids, _term_id_type).tobytes(),
+		numpy.array(row_weights, _weight_type).tobytes(),
+		column_offsets.astype(_offset_type).tobytes(),
+		column_rows.tobytes(),
+		column_weights.tobytes(),
+		term_max_normalized_weights.tobytes(),
+		term_bytes]
+
+	header = _header.pack(
+		_tf_idf_matrix_magic,
+		tf_idf_matrix_format_version,
+		len(page_ids),
+		len(terms),
+		len(row_term_ids),
+		len(term_bytes))
+	write_aligned_sections(file_name, header, sections)
+
+
+class TfIdfMatrix(MappedFile):
+	def __init__(self, file_name: Union[str, Path]):
+		super().__init__(file_name, _header, _tf_idf_matrix_magic, tf_idf_matrix_format_version, "TF-IDF matrix")
+		page_count, term_count, nonzero_count, term_bytes_size = self._header_values
+
+		# Arrays are read-only views of the mapped file: nothing is copied, and every process that loads
+		# the same file shares its pages through the page cache
+		self.page_ids = self._read_array(_page_id_type, page_count)
+		self.row_offsets = self._read_array(_offset_type, page_count + 1)
+		self.norms = self._read_array(_weight_type, page_count)
+		self.idf = self._read_array(_weight_type, term_count)
+		self._term_offsets = self._read_array(_offset_type, term_count + 1)
+		self.term_ids = self._read_array(_term_id_type, nonzero_count)
+		self.weights = self._read_array(_weight_type, nonzero_count)
+		self.column_offsets = self._read_array(_offset_type, term_count + 1)
+		self.column_rows = self._read_array(_page_id_type, nonzero_count)
+		self.column_weights = self._read_array(_weight_type, nonzero_count)
+		self.term_max_normalized_weights = self._read_array(_bound_type, term_count)
+		self._term_bytes_offset = self._section_offset
+		self._term_bytes_size = term_bytes_size
+
+	def __len__(self) -> int:
+		return len(self.page_ids)
+
+	def get_term_count(self) -> int:
+		return len(self.idf)
+
+	def get_terms(self) -> List[str]:
+		term_bytes = self._mmap[self._term_bytes_offset:self._term_bytes_offset + self._term_bytes_size]
+		term_offsets = self._term_offsets.tolist()
+		return [
+			term_bytes[term_offsets[term_id]:term_offsets[term_id + 1]].decode("utf-8")
+			for term_id in range(len(term_offsets) - 1)]
+
+	def get_term(self, term_id: int) -> str:
+		return self._read_term(term_id).decode("utf-8")
+
+	def get_term_id(self, term: str) -> Optional[int]:
+		# A binary search over the mapped terms, so no process builds a dictionary of the whole vocabulary
+		encoded_term = term.encode("utf-8")
+		low = 0
+		high = self.get_term_count()
+		while low < high:
+			middle = (low + high) // 2
+			middle_term = self._read_term(middle)
+			if middle_term < encoded_term:
+				low = middle + 1
+			elif middle_term > encoded_term:
+				high = middle
+			else:
+				return middle
+		return None
+
+	def get_idf(self) -> Dict[str, float]:
+		return dict(zip(self.get_terms(), self.idf.tolist()))
+
+	def get_row(self, row: int) -> Tuple[NDArray[numpy.uint32], NDArray[numpy.float32]]:
+		start = int(self.row_offsets[row])
+		end = int(self.row_offsets[row + 1])
+		return self.term_ids[start:end], self.weights[start:end]
+
+	def get_column(self, term_id: int) -> Tuple[NDArray[numpy.uint32], NDArray[numpy.float32]]:
+		start = int(self.column_offsets[term_id])
+		end = int(self.column_offsets[term_id + 1])
+		return self.column_rows[start:end], self.column_weights[start:end]
+
+	def get_normalized_column(self, term_id: int) -> Tuple[NDArray[numpy.uint32], NDArray[numpy.float64]]:
+		rows, weights = self.get_column(term_id)
+		return rows, normalize_weights(weights, self.norms[rows].astype(numpy.float64))
+
+	def get_page_weights(self, row: int) -> Dict[str, float]:
+		term_ids, weights = self.get_row(row)
+		return {self.get_term(term_id): weight for term_id, weight in zip(term_ids.tolist(), weights.tolist())}
+
+	def _read_term(self, term_id: int) -> bytes:
+		start = self._term_bytes_offset + int(self._term_offsets[term_id])
+		end = self._term_bytes_offset + int(self._term_offsets[term_id + 1])
+		return self._mmap[start:end]
+
+
+def normalize_weights(weights: NDArray[numpy.floating[Any]], norms: NDArray[numpy.float64]) -> NDArray[numpy.float64]:
+	return numpy.divide(
+		weights.astype(numpy.float64),
+		norms,
+		out = numpy.zeros(len(weights), numpy.float64),
+		where = norms != 0)